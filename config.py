@@ -14,15 +14,7 @@ FALLBACK_MODELS = ["mixtral", "llama3", "gemma"]
 # Directory configurations
 ROOT_DIR = Path(__file__).parent.parent
 PLOTS_DIR = os.path.join(ROOT_DIR, "saved_plots")
-TEMP_DIR = tempfile.mkdtemp()
-
-# Ensure required directories exist
-os.makedirs(PLOTS_DIR, exist_ok=True)
-
-# Environment variables for temporary files
-os.environ["TMPDIR"] = TEMP_DIR
-os.environ["TEMP"] = TEMP_DIR
-os.environ["TMP"] = TEMP_DIR
+TEMP_DIR = None  # Created by setup_environment()
 
 # Smart Dataframe configuration
 DATAFRAME_CONFIG = {
@@ -32,9 +24,82 @@ DATAFRAME_CONFIG = {
     "display_progress_bar": False,  # Disable progress bar
 }
 
+# Generated code optimization configuration
+CODE_OPTIMIZATION_CONFIG = {
+    "enabled": False,  # Analyze generated code and request vectorized rewrites
+    "time_threshold": 1.0,  # Seconds of PandasAI execution time that trigger a rewrite
+    "time_limit": 10.0,  # Seconds after which code run outside PandasAI is killed
+}
+
+# Model routing configuration
+MODEL_ROUTING_CONFIG = {
+    "enabled": False,  # Route each question to a model tier instead of the selected model
+    "tiers": {  # Ordered from smallest (fastest) to largest (most capable)
+        "small": ["llama3.2:3b", "phi3"],
+        "large": ["mixtral", "llama3"],
+    },
+    "complexity_threshold": 1,  # Complexity score at which the large tier is used
+    "min_success_rate": 0.5,  # Models below this success rate are skipped
+    "min_samples": 3,  # Calls observed before the success rate is trusted
+    "latency_smoothing": 0.3,  # Weight of the latest latency in the moving average
+    "stats_decay": 0.9,  # Weight kept by older calls in the success rate at each new call
+    "retry_interval": 300,  # Seconds after which a skipped model is tried again
+}
+
+# Persistent store configuration
+STORE_CONFIG = {
+    "enabled": True,  # Persist sessions, datasets and results across restarts
+    "path": os.path.join(ROOT_DIR, "session_store"),  # SQLite database and columnar files
+    "reuse_results": True,  # Answer repeated questions on the same dataset from the store
+    "max_age_days": 30,  # Prune sessions, answers and unused datasets older than this
+    "max_bytes": 2 * 1024 ** 3,  # Prune the oldest answers and unused datasets above this size
+}
+
+# Metrics configuration
+METRICS_CONFIG = {
+    "enabled": True,  # Record query, cache and memory metrics and start the exporters
+    "host": "127.0.0.1",  # Interface of the Prometheus endpoint
+    "port": 9464,  # Port of the /metrics endpoint, None to disable
+    "file": None,  # Optional path the metrics are written to periodically
+    "file_interval": 15,  # Seconds between two metrics file writes
+    "latency_buckets": [0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120],  # Query latency buckets (s)
+}
+
 # Example questions to display in the UI
 EXAMPLE_QUESTIONS = [
     "How many rows are in this dataset?",
     "What are the column names?",
     "Show me a summary of the numerical columns"
-]
\ No newline at end of file
+]
+
+# Background prefetch configuration
+PREFETCH_CONFIG = {
+    "enabled": False,  # Precompute answers right after a dataset is loaded
+    "questions": EXAMPLE_QUESTIONS,  # Questions to answer in the background
+    "delay": 0.5,  # Seconds to pause between prefetched questions
+}
+
+
+def setup_environment():
+    """
+    Create required directories and point temporary files at a private directory.
+    
+    This is called explicitly at startup instead of at import time, and is
+    safe to call repeatedly (e.g. on every Streamlit rerun).
+    
+    Returns:
+        str: The temporary directory in use
+    """
+    global TEMP_DIR
+    if TEMP_DIR is not None:
+        return TEMP_DIR
+    
+    # Ensure required directories exist
+    os.makedirs(PLOTS_DIR, exist_ok=True)
+    
+    # Environment variables for temporary files
+    TEMP_DIR = tempfile.mkdtemp()
+    os.environ["TMPDIR"] = TEMP_DIR
+    os.environ["TEMP"] = TEMP_DIR
+    os.environ["TMP"] = TEMP_DIR
+    return TEMP_DIR
@@ -1,7 +1,18 @@
 """
 Core functionality for data analysis using SmartDataframe.
 """
+import time
+
 import streamlit as st
+from config import STORE_CONFIG
+from core.dataframe import (create_smart_dataframe, get_last_execution_time,
+                            get_smart_dataframe_data, update_smart_dataframe)
+from core.llm import create_ollama_llm
+from core.metrics import (CACHE_LOOKUPS, QUERIES, QUERY_ERRORS, QUERY_LATENCY,
+                          frame_memory_bytes, track_session)
+from core.optimizer import CodeOptimizer, produces_plot, time_code_execution
+from core.prefetch import QueryPrefetcher
+from core.router import ModelRouter, is_failed_response
 from utils.image_handler import make_persistent_copy, is_image_path
 
 
@@ -11,26 +22,63 @@ class DataAnalyzer:
     Handles query processing, response management, and conversation history.
     """
     
-    def __init__(self, smart_df=None):
+    def __init__(self, smart_df=None, raw_df=None, optimizer=None, router=None,
+                 prefetcher=None, store=None, session_id=None):
         """
         Initialize the DataAnalyzer.
         
         Args:
             smart_df: Optional SmartDataframe instance
+            raw_df (pandas.DataFrame): Optional raw dataframe behind the SmartDataframe
+            optimizer (CodeOptimizer): Optional optimizer for slow generated code
+            router (ModelRouter): Optional router choosing a model per query
+            prefetcher (QueryPrefetcher): Optional background answer prefetcher
+            store (ResultStore): Optional store persisting state across restarts
+            session_id (str): Identifier of the session in the store
         """
         self.smart_df = smart_df
+        self.raw_df = raw_df
+        self.model_name = None
+        self.optimizer = optimizer or CodeOptimizer()
+        self.router = router or ModelRouter()
+        self.prefetcher = prefetcher or QueryPrefetcher()
+        self.store = store
+        self.session_id = session_id
+        self.dataset_key = None
+        self.reuse_results = STORE_CONFIG["reuse_results"]
         self.conversation = []
+        track_session(self)
         self.current_query = None
         self.processing = False
         
-    def set_dataframe(self, smart_df):
+    def set_dataframe(self, smart_df, raw_df=None, model_name=None, dataset_key=None):
         """
         Set the SmartDataframe to use for analysis.
         
         Args:
             smart_df: The SmartDataframe instance
+            raw_df (pandas.DataFrame): The raw dataframe behind the SmartDataframe
+            model_name (str): Name of the model the SmartDataframe uses
+            dataset_key (str): Identifier of the dataset version, used by the store
         """
         self.smart_df = smart_df
+        self.raw_df = raw_df
+        self.model_name = model_name
+        self.dataset_key = dataset_key
+        self.router.reset_dataframes()
+        # Prefetched answers belong to the previous dataset or model
+        self.prefetcher.reset()
+        self._measure_memory(raw_df)
+        
+        if self.store is not None and self.session_id and dataset_key:
+            self.store.save_session(self.session_id, dataset_key, model_name)
+        
+    def restore_conversation(self):
+        """Reload the conversation history persisted for this session."""
+        if self.store is not None and self.session_id:
+            self.conversation = self.store.load_conversation(self.session_id)
+            for entry in self.conversation:
+                self._measure_memory(entry[1])
         
     def process_query(self, query):
         """
@@ -48,25 +96,250 @@ class DataAnalyzer:
         if not query:
             return False, "Query cannot be empty."
             
+        start = time.perf_counter()
+        success, error, source = self._answer_query(query)
+        
+        # Record metrics for the query
+        QUERY_LATENCY.observe(time.perf_counter() - start, source=source)
+        QUERIES.inc(source=source)
+        if not success or is_failed_response(self.conversation[-1][1]):
+            QUERY_ERRORS.inc()
+        return success, error
+        
+    def _answer_query(self, query):
+        """
+        Answer a query from the caches or the LLM.
+        
+        Args:
+            query (str): The user's query
+            
+        Returns:
+            tuple: (success, error_message, source) where source is where
+            the answer came from: prefetch, store, replay or llm
+        """
+        # The user's own query always takes priority over prefetching
+        self.prefetcher.cancel()
+        # Prefetched answers come from the selected model, routing picks its own
+        if not self.router.enabled:
+            cached = self.prefetcher.get(query, self.model_name)
+            CACHE_LOOKUPS.inc(cache="prefetch", result="miss" if cached is None else "hit")
+            if cached is not None:
+                self._add_entry(query, *cached)
+                return True, None, "prefetch"
+            
+        # Answers persisted for this dataset version survive restarts
+        stored = self._get_stored_result(query)
+        CACHE_LOOKUPS.inc(cache="store", result="miss" if stored is None else "hit")
+        if stored is not None:
+            response, code, details, artifact_id = stored
+            self._add_entry(query, response, code, dict(details, restored=True),
+                            save=False, artifact_id=artifact_id)
+            return True, None, "store"
+            
+        # Code generated for an earlier version of the dataset is replayed without the LLM
+        replayed = self._replay_stored_code(query)
+        if replayed is not None:
+            self._add_entry(query, *replayed)
+            return True, None, "replay"
+            
         try:
             # Always send the query to the LLM for processing
-            response = self.smart_df.chat(query)
-            code = self.smart_df.last_code_executed
+            if self.router.enabled and self.raw_df is not None:
+                smart_df, response, code, details = self.router.chat(query, self.raw_df)
+            else:
+                smart_df = self.smart_df
+                response = smart_df.chat(query)
+                code = smart_df.last_code_executed
+                details = {"model": self.model_name}
             
             # Handle image responses
             if is_image_path(response):
                 persistent_path = make_persistent_copy(response)
                 if persistent_path:
                     response = persistent_path
+            elif not is_failed_response(response):
+                # Replace slow generated code with a faster vectorized rewrite,
+                # an optimizer failure must never discard a valid answer
+                try:
+                    response, code = self.optimizer.optimize(
+                        self.raw_df, query, response, code,
+                        details.get("model") or self.model_name,
+                        get_last_execution_time(smart_df)
+                    )
+                except Exception as e:
+                    print(f"Error optimizing generated code: {str(e)}")
             
             # Add to conversation history
-            self.conversation.append((query, response, code))
-            return True, None
+            self._add_entry(query, response, code, details)
+            return True, None, "llm"
                 
         except Exception as e:
             error_msg = f"Error analyzing data: {str(e)}"
-            return False, error_msg
+            return False, error_msg, "llm"
             
+    def _get_stored_result(self, query):
+        """
+        Look up a persisted answer for the query on the current dataset.
+        
+        Args:
+            query (str): The user's query
+            
+        Returns:
+            tuple or None: (response, code, details, artifact_id) if an answer is stored
+        """
+        if self.store is None or not self.dataset_key or not self.reuse_results:
+            return None
+        try:
+            return self.store.get_result(self.dataset_key, self._result_model(), query)
+        except Exception as e:
+            print(f"Error reading stored result: {str(e)}")
+            return None
+            
+    def _replay_stored_code(self, query):
+        """
+        Re-run code the current model generated for the query on an earlier
+        version of the dataset.
+        
+        Args:
+            query (str): The user's query
+            
+        Returns:
+            tuple or None: (response, code, details) if stored code ran successfully
+        """
+        if (self.store is None or not self.dataset_key or self.raw_df is None
+                or not self.reuse_results):
+            return None
+            
+        try:
+            stored = self.store.get_code(self.dataset_key, self._result_model(), query)
+        except Exception as e:
+            print(f"Error reading stored code: {str(e)}")
+            return None
+        if stored is None:
+            return None
+        code, details = stored
+        # Plots are regenerated by the LLM pipeline so the chart files stay managed,
+        # skip them before running anything
+        if not code or produces_plot(code):
+            return None
+            
+        result, _ = time_code_execution(code, self.raw_df, self.optimizer.time_limit)
+        if not isinstance(result, dict) or result.get("type") == "plot":
+            return None
+        # Labelled with the model that generated the code
+        model = details.get("model") or self._result_model()
+        return result.get("value"), code, {"model": model, "replayed": True}
+        
+    def append_data(self, delta_df, dataset_key):
+        """
+        Append rows to the loaded dataset without rebuilding derived state.
+        
+        Only state that depends on the previous dataset version is
+        invalidated: its stored answers and prefetched answers. Stored
+        generated code is kept so it can be replayed on the new version.
+        
+        Args:
+            delta_df (pandas.DataFrame): Rows to append, already aligned to the schema
+            dataset_key (str): Identifier of the new dataset version
+            
+        Returns:
+            pandas.DataFrame: The combined dataset
+        """
+        import pandas as pd
+        
+        previous_key = self.dataset_key
+        df = pd.concat([self.raw_df, delta_df], ignore_index=True)
+        
+        # Reuse the existing PandasAI agents where possible
+        if not update_smart_dataframe(self.smart_df, df):
+            self.smart_df = create_smart_dataframe(df, create_ollama_llm(self.model_name))
+        self.router.update_dataframes(df)
+        self.prefetcher.reset()
+        
+        self.raw_df = df
+        self.dataset_key = dataset_key
+        self._measure_memory(df)
+        
+        if self.store is not None:
+            self.store.save_dataset(dataset_key, df, parent_key=previous_key)
+            if previous_key:
+                self.store.invalidate_results(previous_key)
+            if self.session_id:
+                self.store.save_session(self.session_id, dataset_key, self.model_name)
+        return df
+        
+    def _add_entry(self, query, response, code, details, save=True, artifact_id=None):
+        """
+        Add an entry to the conversation history and persist it.
+        
+        Args:
+            query (str): The user's query
+            response: The response to the query
+            code (str): The generated code
+            details (dict): Routing and processing details
+            save (bool): Whether to also store the answer for reuse
+            artifact_id (str): Stored artifact already holding the response
+        """
+        entry = (query, response, code, details)
+        self.conversation.append(entry)
+        self._measure_memory(response)
+        if self.store is None:
+            return
+            
+        # Persistence must never fail the query itself
+        try:
+            save = save and self.dataset_key and not is_failed_response(response)
+            self.store.save_answer(
+                entry,
+                session_id=self.session_id,
+                position=len(self.conversation) - 1,
+                dataset_key=self.dataset_key if save else None,
+                model_name=self._result_model(),
+                artifact_id=artifact_id
+            )
+        except Exception as e:
+            print(f"Error persisting conversation entry: {str(e)}")
+            
+    def _result_model(self):
+        """
+        Get the model name stored answers are keyed by.
+        
+        Returns:
+            str: The selected model, or 'router' when routing picks the model per query
+        """
+        return "router" if self.router.enabled else self.model_name
+        
+    def clear_stored_results(self):
+        """Delete the stored answers of the current dataset so questions are recomputed."""
+        self.prefetcher.reset()
+        if self.store is not None and self.dataset_key:
+            self.store.clear_results(self.dataset_key)
+            
+    def get_memory_usage(self):
+        """
+        Get the memory held by the dataframes of this session.
+        
+        Counts the raw dataset, the data behind the SmartDataframes of the
+        analyzer, router and prefetcher, and dataframe answers. Dataframes
+        shared between them are counted once; sizes are deep and cached per
+        dataframe (see frame_memory_bytes).
+        
+        Returns:
+            int: Memory usage in bytes
+        """
+        smart_dfs = [self.smart_df, self.prefetcher.smart_df] + self.router.smart_dataframes()
+        frames = [self.raw_df] + [get_smart_dataframe_data(smart_df) for smart_df in smart_dfs]
+        frames += [entry[1] for entry in self.conversation]
+        
+        distinct = {id(frame): frame for frame in frames if hasattr(frame, "memory_usage")}
+        return sum(frame_memory_bytes(frame) for frame in distinct.values())
+        
+    @staticmethod
+    def _measure_memory(frame):
+        """Measure a new dataframe up front so the memory gauge stays cheap to render."""
+        if hasattr(frame, "memory_usage"):
+            frame_memory_bytes(frame)
+        
     def get_conversation_history(self):
         """
         Get the conversation history.
@@ -78,4 +351,6 @@ class DataAnalyzer:
         
     def clear_conversation(self):
         """Clear the conversation history."""
-        self.conversation = []
\ No newline at end of file
+        self.conversation = []
+        if self.store is not None and self.session_id:
+            self.store.clear_conversation(self.session_id)
\ No newline at end of file
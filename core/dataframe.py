@@ -1,65 +1,85 @@
 """
 Core functionality for managing SmartDataframes.
+
+PandasAI is imported lazily because it is by far the slowest dependency to
+import; the parser class is built on first use and cached.
 """
-import pandas as pd
-from pandasai import SmartDataframe
-from pandasai.responses.response_parser import ResponseParser
+from functools import lru_cache
 
 from config import DATAFRAME_CONFIG
 
 
-class CaptureResponseParser(ResponseParser):
+@lru_cache(maxsize=None)
+def get_response_parser_class():
     """
-    Custom response parser that captures results without displaying them.
+    Build the CaptureResponseParser class on first use.
     
-    This prevents PandasAI from automatically displaying results, allowing
-    our application to handle the display in a more controlled manner.
+    Returns:
+        type: The CaptureResponseParser class
     """
+    from pandasai.responses.response_parser import ResponseParser
     
-    def __init__(self, context) -> None:
+    class CaptureResponseParser(ResponseParser):
         """
-        Initialize the response parser.
+        Custom response parser that captures results without displaying them.
         
-        Args:
-            context: The PandasAI context
+        This prevents PandasAI from automatically displaying results, allowing
+        our application to handle the display in a more controlled manner.
         """
-        super().__init__(context)
+    
+        def __init__(self, context) -> None:
+            """
+            Initialize the response parser.
         
-    def format_dataframe(self, result):
-        """
-        Format a dataframe result.
+            Args:
+                context: The PandasAI context
+            """
+            super().__init__(context)
         
-        Args:
-            result (dict): The result containing a dataframe
+        def format_dataframe(self, result):
+            """
+            Format a dataframe result.
+        
+            Args:
+                result (dict): The result containing a dataframe
             
-        Returns:
-            pd.DataFrame: The dataframe result
-        """
-        return result["value"]
+            Returns:
+                pd.DataFrame: The dataframe result
+            """
+            return result["value"]
         
-    def format_plot(self, result):
-        """
-        Format a plot result.
+        def format_plot(self, result):
+            """
+            Format a plot result.
         
-        Args:
-            result (dict): The result containing a plot
+            Args:
+                result (dict): The result containing a plot
             
-        Returns:
-            str: The path to the generated plot
-        """
-        return result["value"]
+            Returns:
+                str: The path to the generated plot
+            """
+            return result["value"]
         
-    def format_other(self, result):
-        """
-        Format other types of results.
+        def format_other(self, result):
+            """
+            Format other types of results.
         
-        Args:
-            result (dict): The result
+            Args:
+                result (dict): The result
             
-        Returns:
-            Any: The result value
-        """
-        return result["value"]
+            Returns:
+                Any: The result value
+            """
+            return result["value"]
+    
+    return CaptureResponseParser
+
+
+def __getattr__(name):
+    """Expose CaptureResponseParser as a lazily created module attribute."""
+    if name == "CaptureResponseParser":
+        return get_response_parser_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def create_smart_dataframe(df, llm):
@@ -73,13 +93,15 @@ def create_smart_dataframe(df, llm):
     Returns:
         SmartDataframe: The configured smart dataframe
     """
+    from pandasai import SmartDataframe
+    
     # Start with the default configuration
     config = DATAFRAME_CONFIG.copy()
     
     # Add the LLM and response parser
     config.update({
         "llm": llm,
-        "response_parser": CaptureResponseParser,
+        "response_parser": get_response_parser_class(),
     })
     
     try:
@@ -89,4 +111,89 @@ def create_smart_dataframe(df, llm):
     except Exception as e:
         # If the full configuration fails, try a minimal configuration
         fallback_config = {"llm": llm, "verbose": True}
-        return SmartDataframe(df, config=fallback_config)
\ No newline at end of file
+        return SmartDataframe(df, config=fallback_config)
+
+
+def update_smart_dataframe(smart_df, df):
+    """
+    Point an existing SmartDataframe at new data with the same schema.
+    
+    This avoids rebuilding the PandasAI agent when rows are appended. It
+    relies on the PandasConnector internals of the pinned PandasAI version.
+    
+    Args:
+        smart_df (SmartDataframe): The smart dataframe to update
+        df (pd.DataFrame): The new data
+        
+    Returns:
+        bool: True if the update succeeded, False if the caller should rebuild
+    """
+    try:
+        connector = smart_df.dataframe
+        connector.pandas_df = df
+        
+        # Drop values PandasAI memoized for the previous data
+        for cached in ("rows_count", "columns_count"):
+            connector.__dict__.pop(cached, None)
+        type(connector).execute.cache_clear()
+        return True
+    except AttributeError:
+        return False
+
+
+def get_smart_dataframe_data(smart_df):
+    """
+    Get the pandas dataframe a SmartDataframe analyzes.
+    
+    PandasAI's connector keeps a reference to the dataframe it was given,
+    so this is usually the same object as the raw dataframe.
+    
+    Args:
+        smart_df (SmartDataframe): The smart dataframe, may be None
+        
+    Returns:
+        pandas.DataFrame or None: The dataframe, or None if it is not available
+    """
+    return getattr(getattr(smart_df, "dataframe", None), "pandas_df", None)
+
+
+def get_last_execution_time(smart_df):
+    """
+    Get how long PandasAI spent executing the code of the last chat.
+    
+    PandasAI times each pipeline step in its query tracker; this relies on
+    the tracker internals of the pinned PandasAI version.
+    
+    Args:
+        smart_df (SmartDataframe): The smart dataframe that answered the last query
+        
+    Returns:
+        float or None: Code execution time in seconds, or None if unavailable
+    """
+    try:
+        steps = smart_df._agent.pipeline.query_exec_tracker._steps
+    except AttributeError:
+        return None
+    for step in reversed(steps):
+        if step.get("type") == "CodeExecution" and step.get("execution_time") is not None:
+            return step["execution_time"]
+    return None
+
+
+def generate_code(df, llm, query):
+    """
+    Ask the LLM for code answering a query without executing it.
+    
+    A throwaway SmartDataframe is used so the query never enters the
+    conversation memory of the user's SmartDataframe.
+    
+    Args:
+        df (pd.DataFrame): The dataframe the code will operate on
+        llm: The LLM instance to use
+        query (str): The prompt
+        
+    Returns:
+        str: The cleaned generated code, or PandasAI's failure message
+    """
+    smart_df = create_smart_dataframe(df, llm)
+    return smart_df._agent.generate_code(query)
@@ -1,23 +1,85 @@
 """
 Core functionality for LLM integration.
 """
-from langchain_community.llms import Ollama
+from functools import lru_cache
 
 
-def create_ollama_llm(model_name):
+class LLMCancelled(Exception):
+    """Raised inside a streaming LLM call when its cancel event is set."""
+
+
+@lru_cache(maxsize=None)
+def get_cancellation_handler_class():
+    """
+    Build the CancellationHandler class on first use.
+
+    Returns:
+        type: The CancellationHandler class
+    """
+    # Imported lazily, langchain is slow to import
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class CancellationHandler(BaseCallbackHandler):
+        """
+        Callback handler that aborts an Ollama request when an event is set.
+
+        The Ollama client streams every request and reports each token to
+        its callbacks. Raising from the callback unwinds the stream and
+        drops the HTTP response, and Ollama stops generating once the client
+        disconnects. The check runs per token, so a request is aborted
+        after its first token at the earliest.
+        """
+
+        # Callback errors are only logged unless the handler asks for them to propagate
+        raise_error = True
+
+        def __init__(self, cancel_event):
+            """
+            Initialize the handler.
+
+            Args:
+                cancel_event (threading.Event): Set when the request must stop
+            """
+            self.cancel_event = cancel_event
+
+        def on_llm_start(self, serialized, prompts, **kwargs):
+            """Refuse to start a request after cancellation."""
+            self._check()
+
+        def on_llm_new_token(self, token, **kwargs):
+            """Abort the request at the next token after cancellation."""
+            self._check()
+
+        def _check(self):
+            """Raise LLMCancelled if the cancel event is set."""
+            if self.cancel_event.is_set():
+                raise LLMCancelled("LLM request cancelled")
+
+    return CancellationHandler
+
+
+def create_ollama_llm(model_name, cancel_event=None):
     """
     Create an Ollama LLM instance with the specified model name.
-    
+
     Args:
         model_name (str): Name of the Ollama model to use
-        
+        cancel_event (threading.Event): Optional event aborting in-flight requests when set
+
     Returns:
         Ollama: Configured Ollama LLM instance
     """
+    # Imported lazily, langchain is slow to import
+    from langchain_community.llms import Ollama
+
+    callbacks = None
+    if cancel_event is not None:
+        callbacks = [get_cancellation_handler_class()(cancel_event)]
+
     try:
         # Create the Ollama LLM with the specified model
-        return Ollama(model=model_name)
+        return Ollama(model=model_name, callbacks=callbacks)
     except Exception as e:
         # If there's an error, log it and use default parameters
         print(f"Error creating Ollama LLM: {str(e)}")
-        return Ollama(model="mixtral")  # Fallback to mixtral
\ No newline at end of file
+        return Ollama(model="mixtral", callbacks=callbacks)  # Fallback to mixtral
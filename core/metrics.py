@@ -0,0 +1,404 @@
+"""
+Core functionality for collecting operational metrics and exporting them
+in the Prometheus text format.
+
+Recording a sample is a dictionary update under a lock, so the metrics are
+cheap enough to leave on. METRICS_CONFIG['enabled'] turns off both recording
+and the exporters. Dataframe memory is measured once per dataframe, when it
+is loaded, and store sizes are only computed when the metrics are
+rendered.
+"""
+import os
+import threading
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_CONFIG, PLOTS_DIR, STORE_CONFIG
+
+
+def format_labels(labels):
+    """
+    Format a label mapping for the Prometheus text format.
+
+    Args:
+        labels (tuple): Sorted (name, value) pairs
+
+    Returns:
+        str: The formatted labels, e.g. '{source="llm"}', or '' without labels
+    """
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        """
+        Initialize the Counter.
+
+        Args:
+            name (str): Metric name
+            help_text (str): Description shown in the export
+            labelnames (tuple): Names of the labels splitting the counter
+        """
+        self.name = name
+        self.help_text = help_text
+        # Unlabelled counters are exported as 0 before their first increment
+        self._values = {} if labelnames else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """
+        Increase the counter.
+
+        Args:
+            amount (float): Amount to add
+            **labels: Label values of the series
+        """
+        if not METRICS_CONFIG["enabled"]:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        """
+        Get the current samples.
+
+        Returns:
+            list: (name, labels, value) tuples
+        """
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        """
+        Initialize the Histogram.
+
+        Args:
+            name (str): Metric name
+            help_text (str): Description shown in the export
+            buckets (list): Upper bounds of the buckets, in increasing order
+            labelnames (tuple): Names of the labels splitting the histogram
+        """
+        self.name = name
+        self.help_text = help_text
+        self.buckets = sorted(buckets)
+        # Unlabelled histograms are exported with empty buckets before their first observation
+        self._series = {} if labelnames else {(): self._new_series()}
+        self._lock = threading.Lock()
+
+    def _new_series(self):
+        """Create the bucket counts, sum and count of one label combination."""
+        return {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+
+    def observe(self, value, **labels):
+        """
+        Record an observation.
+
+        Args:
+            value (float): The observed value
+            **labels: Label values of the series
+        """
+        if not METRICS_CONFIG["enabled"]:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, self._new_series())
+            series["sum"] += value
+            series["count"] += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+
+    def quantile(self, q, **labels):
+        """
+        Estimate a quantile from the buckets.
+
+        Args:
+            q (float): Quantile between 0 and 1
+            **labels: Label values of the series
+
+        Returns:
+            float or None: Upper bound of the bucket holding the quantile,
+            inf beyond the last bucket, None without observations
+        """
+        with self._lock:
+            series = self._series.get(tuple(sorted(labels.items())))
+            if not series or not series["count"]:
+                return None
+            target = q * series["count"]
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                if cumulative >= target:
+                    return bound
+        return float("inf")
+
+    def samples(self):
+        """
+        Get the current samples.
+
+        Returns:
+            list: (name, labels, value) tuples for buckets, sum and count
+        """
+        with self._lock:
+            samples = []
+            for key, series in self._series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket", key + (("le", bound),), cumulative))
+                samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),), series["count"]))
+                samples.append((f"{self.name}_sum", key, series["sum"]))
+                samples.append((f"{self.name}_count", key, series["count"]))
+            return samples
+
+
+class Gauge:
+    """Value computed by a callback when the metrics are rendered."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, callback):
+        """
+        Initialize the Gauge.
+
+        Args:
+            name (str): Metric name
+            help_text (str): Description shown in the export
+            callback: Function returning the current value
+        """
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+
+    def samples(self):
+        """
+        Get the current sample.
+
+        Returns:
+            list: A single (name, labels, value) tuple, empty if the callback failed
+        """
+        try:
+            return [(self.name, (), self.callback())]
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {str(e)}")
+            return []
+
+
+class MetricsRegistry:
+    """
+    Class holding all metrics of the process and rendering them.
+    """
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self.metrics = []
+
+    def register(self, metric):
+        """
+        Add a metric to the registry.
+
+        Args:
+            metric: A Counter, Histogram or Gauge
+
+        Returns:
+            The registered metric
+        """
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The exported metrics
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def directory_size(path):
+    """
+    Compute the total size and number of files in a directory tree.
+
+    Args:
+        path (str): The directory
+
+    Returns:
+        tuple: (total_bytes, file_count), zeros if the directory does not exist
+    """
+    total, count = 0, 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+                count += 1
+            except OSError:
+                continue
+    return total, count
+
+
+# Analyzers of live sessions, dropped automatically when a session ends
+_sessions = weakref.WeakSet()
+
+
+def track_session(analyzer):
+    """
+    Include an analyzer in the session gauges.
+
+    Args:
+        analyzer (DataAnalyzer): The analyzer of a session
+    """
+    _sessions.add(analyzer)
+
+
+def sessions_memory_bytes():
+    """Get the memory held by the dataframes of all live sessions."""
+    return sum(analyzer.get_memory_usage() for analyzer in list(_sessions))
+
+
+# Deep memory sizes by dataframe id, each entry is dropped with its dataframe
+_frame_sizes = {}
+
+
+def frame_memory_bytes(frame):
+    """
+    Get the deep memory usage of a dataframe, measured once per dataframe.
+
+    Measuring string columns deeply scans every value, so the size is
+    cached until the dataframe is garbage collected. Callers measure new
+    dataframes when they are loaded so rendering the metrics stays cheap.
+
+    Args:
+        frame (pandas.DataFrame or pandas.Series): The dataframe to measure
+
+    Returns:
+        int: Memory usage in bytes, including the contents of object columns
+    """
+    key = id(frame)
+    cached = _frame_sizes.get(key)
+    if cached is not None and cached[0]() is frame:
+        return cached[1]
+
+    usage = frame.memory_usage(deep=True)
+    size = int(usage.sum() if hasattr(usage, "sum") else usage)
+    _frame_sizes[key] = (weakref.ref(frame, lambda _, key=key: _frame_sizes.pop(key, None)),
+                         size)
+    return size
+
+
+METRICS = MetricsRegistry()
+
+QUERIES = METRICS.register(Counter(
+    "ttyd_queries_total", "Queries processed, by answer source (llm, prefetch, store, replay).",
+    labelnames=("source",)))
+QUERY_ERRORS = METRICS.register(Counter(
+    "ttyd_query_errors_total", "Queries that failed."))
+QUERY_LATENCY = METRICS.register(Histogram(
+    "ttyd_query_latency_seconds",
+    "End-to-end query latency in seconds, by answer source (llm, prefetch, store, replay).",
+    METRICS_CONFIG["latency_buckets"], labelnames=("source",)))
+CACHE_LOOKUPS = METRICS.register(Counter(
+    "ttyd_cache_lookups_total", "Answer cache lookups, by cache and result (hit, miss).",
+    labelnames=("cache", "result")))
+CODE_REWRITES = METRICS.register(Counter(
+    "ttyd_code_rewrites_total", "Vectorized rewrites requested, by outcome (kept, rejected).",
+    labelnames=("outcome",)))
+METRICS.register(Gauge(
+    "ttyd_sessions", "Live sessions with an analyzer.", lambda: len(_sessions)))
+METRICS.register(Gauge(
+    "ttyd_sessions_memory_bytes", "Approximate memory held by session dataframes.",
+    sessions_memory_bytes))
+METRICS.register(Gauge(
+    "ttyd_dataset_store_bytes", "Size of the persistent dataset and result store.",
+    lambda: directory_size(STORE_CONFIG["path"])[0]))
+METRICS.register(Gauge(
+    "ttyd_plot_store_bytes", "Size of the saved plots directory.",
+    lambda: directory_size(PLOTS_DIR)[0]))
+METRICS.register(Gauge(
+    "ttyd_plot_store_files", "Number of saved plots.",
+    lambda: directory_size(PLOTS_DIR)[1]))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """HTTP handler serving the metrics at /metrics."""
+
+    def do_GET(self):
+        """Serve the Prometheus text export."""
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Silence the per-request access log."""
+
+
+def _write_metrics_file(path, interval):
+    """Write the metrics to a file periodically, replacing it atomically."""
+    while True:
+        try:
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "w") as f:
+                f.write(METRICS.render())
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing metrics file: {str(e)}")
+        time.sleep(interval)
+
+
+_exporter_started = False
+
+
+def start_metrics_exporter():
+    """
+    Start the configured exporters (HTTP endpoint and/or file) once per process.
+
+    Safe to call repeatedly, e.g. on every Streamlit rerun.
+    """
+    global _exporter_started
+    if _exporter_started or not METRICS_CONFIG["enabled"]:
+        return
+    _exporter_started = True
+
+    if METRICS_CONFIG["port"]:
+        try:
+            server = ThreadingHTTPServer((METRICS_CONFIG["host"], METRICS_CONFIG["port"]),
+                                         MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-http",
+                             daemon=True).start()
+        except OSError as e:
+            print(f"Error starting metrics endpoint: {str(e)}")
+
+    if METRICS_CONFIG["file"]:
+        threading.Thread(target=_write_metrics_file, name="metrics-file", daemon=True,
+                         args=(METRICS_CONFIG["file"], METRICS_CONFIG["file_interval"])).start()
@@ -0,0 +1,430 @@
+"""
+Core functionality for detecting and rewriting slow generated code.
+"""
+import ast
+import multiprocessing
+import time
+
+from config import CODE_OPTIMIZATION_CONFIG
+from core.dataframe import generate_code
+from core.llm import create_ollama_llm
+from core.metrics import CODE_REWRITES
+from core.router import is_failed_response
+
+
+# Method calls that iterate over a dataframe row by row
+ROW_ITERATION_METHODS = {"iterrows", "itertuples"}
+
+# Libraries and method calls that draw or save charts
+PLOT_MODULES = {"matplotlib", "seaborn", "plotly"}
+PLOT_METHODS = {"savefig", "show"}
+
+# Seconds allowed for a worker process to start, not counted in the time limit
+WORKER_START_TIMEOUT = 60
+
+
+class SlowPatternVisitor(ast.NodeVisitor):
+    """
+    AST visitor that collects known slow pandas patterns in generated code.
+    """
+
+    def __init__(self):
+        """Initialize the visitor with an empty list of findings."""
+        self.findings = []
+        self._row_loop_depth = 0
+
+    def visit_Call(self, node):
+        """
+        Flag row-wise iteration and row-wise apply calls.
+
+        Args:
+            node (ast.Call): The call node being visited
+        """
+        if isinstance(node.func, ast.Attribute):
+            method = node.func.attr
+            if method in ROW_ITERATION_METHODS:
+                self._add(node, f"row iteration with .{method}()")
+            elif method == "apply" and self._is_row_wise(node):
+                self._add(node, "row-wise .apply(axis=1)")
+            elif method in ("append", "concat") and self._row_loop_depth:
+                self._add(node, f"incremental .{method}() inside a row loop")
+        self.generic_visit(node)
+
+    def visit_For(self, node):
+        """
+        Flag Python loops over dataframe rows or index ranges.
+
+        Args:
+            node (ast.For): The loop node being visited
+        """
+        row_loop = self._iterates_over_rows(node.iter)
+        if row_loop:
+            self._add(node, "Python for loop over dataframe rows")
+        # Row iteration methods are flagged by visit_Call, but still make this a row loop
+        row_loop = row_loop or self._is_row_iteration_call(node.iter)
+
+        self._row_loop_depth += row_loop
+        self.generic_visit(node)
+        self._row_loop_depth -= row_loop
+
+    def visit_Subscript(self, node):
+        """
+        Flag element-wise .iloc/.loc/.at access inside row loops.
+
+        Args:
+            node (ast.Subscript): The subscript node being visited
+        """
+        if (self._row_loop_depth and isinstance(node.value, ast.Attribute)
+                and node.value.attr in ("iloc", "loc", "at", "iat")):
+            self._add(node, f"element-wise .{node.value.attr}[] access inside a row loop")
+        self.generic_visit(node)
+
+    def _add(self, node, description):
+        """Record a finding with its line number, skipping duplicates."""
+        finding = f"line {getattr(node, 'lineno', '?')}: {description}"
+        if finding not in self.findings:
+            self.findings.append(finding)
+
+    @staticmethod
+    def _is_row_wise(node):
+        """Check whether an apply call runs over rows (axis=1 or axis='columns')."""
+        for keyword in node.keywords:
+            if keyword.arg == "axis" and isinstance(keyword.value, ast.Constant):
+                return keyword.value.value in (1, "columns")
+        return False
+
+    @staticmethod
+    def _is_row_iteration_call(iter_node):
+        """Check whether a loop iterable is an iterrows()/itertuples() call."""
+        return (isinstance(iter_node, ast.Call) and isinstance(iter_node.func, ast.Attribute)
+                and iter_node.func.attr in ROW_ITERATION_METHODS)
+
+    @staticmethod
+    def _iterates_over_rows(iter_node):
+        """Check whether a loop iterable looks like range(len(df)) or df.index."""
+        if isinstance(iter_node, ast.Call) and isinstance(iter_node.func, ast.Name):
+            if iter_node.func.id == "range" and iter_node.args:
+                arg = iter_node.args[-1] if len(iter_node.args) > 1 else iter_node.args[0]
+                return (isinstance(arg, ast.Call) and isinstance(arg.func, ast.Name)
+                        and arg.func.id == "len")
+        if isinstance(iter_node, ast.Attribute) and iter_node.attr in ("index", "values"):
+            return True
+        return False
+
+
+def find_slow_patterns(code):
+    """
+    Parse generated code and return the known slow patterns it contains.
+
+    Args:
+        code (str): The generated Python code
+
+    Returns:
+        list: Human readable descriptions of the slow patterns found
+    """
+    if not code:
+        return []
+
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+
+    visitor = SlowPatternVisitor()
+    visitor.visit(tree)
+    return visitor.findings
+
+
+def produces_plot(code):
+    """
+    Check whether generated code draws a chart, without running it.
+
+    PandasAI plot code imports a charting library, saves the figure and
+    returns a result of type 'plot'.
+
+    Args:
+        code (str): The generated Python code
+
+    Returns:
+        bool: True if the code looks like it produces a plot
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            if any(alias.name.split(".")[0] in PLOT_MODULES for alias in node.names):
+                return True
+        elif isinstance(node, ast.ImportFrom):
+            if node.module and node.module.split(".")[0] in PLOT_MODULES:
+                return True
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            if node.func.attr in PLOT_METHODS:
+                return True
+        elif isinstance(node, ast.Constant) and node.value == "plot":
+            # The {"type": "plot", ...} result declaration
+            return True
+    return False
+
+
+def _execute_code(code, df):
+    """
+    Execute generated code against a copy of the dataframe and time it.
+
+    Args:
+        code (str): The generated Python code
+        df (pandas.DataFrame): The dataframe the code operates on
+
+    Returns:
+        tuple: (result, elapsed_seconds), result is None if execution failed
+    """
+    import numpy as np
+    import pandas as pd
+
+    data = df.copy()
+    environment = {"pd": pd, "np": np, "dfs": [data], "df": data}
+
+    start = time.perf_counter()
+    try:
+        exec(code, environment)
+    except Exception as e:
+        print(f"Error timing generated code: {str(e)}")
+        return None, time.perf_counter() - start
+    return environment.get("result"), time.perf_counter() - start
+
+
+def _execute_code_worker(code, df, connection):
+    """Worker process entry point, sends (result, elapsed_seconds) back over the pipe."""
+    connection.send("started")
+    result, elapsed = _execute_code(code, df)
+    try:
+        connection.send((result, elapsed))
+    except Exception as e:
+        # Results such as figures may not be picklable
+        print(f"Error returning generated code result: {str(e)}")
+        connection.send((None, elapsed))
+
+
+def time_code_execution(code, df, time_limit=None):
+    """
+    Execute generated code against a copy of the dataframe and time it.
+
+    The environment mirrors the one PandasAI uses: the dataframe is exposed
+    as both ``dfs[0]`` and ``df`` and the code must assign ``result``.
+
+    With a time limit, the code runs in a separate process that is killed
+    at the deadline, so any code, including tight loops and long vectorized
+    calls, is stopped. Starting the process and transferring the dataframe
+    and result add overhead that is not counted in the time limit.
+
+    Args:
+        code (str): The generated Python code
+        df (pandas.DataFrame): The dataframe the code operates on
+        time_limit (float): Optional maximum execution time in seconds
+
+    Returns:
+        tuple: (result, elapsed_seconds), result is None if execution failed
+        or was aborted; elapsed_seconds is then at least time_limit on abort
+    """
+    if time_limit is None:
+        return _execute_code(code, df)
+
+    # Spawned rather than forked, the server process runs several threads
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_execute_code_worker, args=(code, df, sender),
+                              name="code-timing", daemon=True)
+    try:
+        process.start()
+        sender.close()
+        if not receiver.poll(WORKER_START_TIMEOUT):
+            print("Error timing generated code: worker did not start")
+            return None, 0.0
+        receiver.recv()
+        start = time.perf_counter()
+        if not receiver.poll(time_limit):
+            return None, max(time.perf_counter() - start, time_limit)
+        return receiver.recv()
+    except (EOFError, OSError) as e:
+        print(f"Error timing generated code: {str(e)}")
+        return None, 0.0
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        receiver.close()
+
+
+def results_match(first, second):
+    """
+    Check whether two PandasAI result values are equivalent.
+
+    Args:
+        first: The first result (usually a dict with 'type' and 'value')
+        second: The second result
+
+    Returns:
+        bool: True if the results are equivalent
+    """
+    import numpy as np
+    import pandas as pd
+    
+    if isinstance(first, dict) and isinstance(second, dict):
+        first, second = first.get("value"), second.get("value")
+
+    if isinstance(first, (pd.DataFrame, pd.Series)) or isinstance(second, (pd.DataFrame, pd.Series)):
+        if type(first) is not type(second):
+            return False
+        try:
+            first = first.reset_index(drop=True)
+            second = second.reset_index(drop=True)
+            if isinstance(first, pd.DataFrame):
+                pd.testing.assert_frame_equal(first, second, check_dtype=False,
+                                              check_exact=False)
+            else:
+                pd.testing.assert_series_equal(first, second, check_dtype=False,
+                                               check_exact=False, check_names=False)
+            return True
+        except AssertionError:
+            return False
+
+    if isinstance(first, (int, float, np.number)) and isinstance(second, (int, float, np.number)):
+        return bool(np.isclose(first, second, equal_nan=True))
+
+    if isinstance(first, np.ndarray) or isinstance(second, np.ndarray):
+        try:
+            return bool(np.array_equal(np.asarray(first), np.asarray(second)))
+        except (TypeError, ValueError):
+            return False
+
+    try:
+        return bool(first == second)
+    except (TypeError, ValueError):
+        # Containers of arrays have no single truth value
+        return False
+
+
+def build_rewrite_prompt(query, code, findings):
+    """
+    Build the prompt asking the LLM for a vectorized version of the code.
+
+    Args:
+        query (str): The original user query
+        code (str): The slow generated code
+        findings (list): Slow patterns detected in the code
+
+    Returns:
+        str: The rewrite prompt
+    """
+    issues = "\n".join(f"- {finding}" for finding in findings) or "- execution was slow"
+    return (
+        f"{query}\n\n"
+        "Answer the question above with fully vectorized pandas code. "
+        "The previous solution was too slow because of:\n"
+        f"{issues}\n\n"
+        "Previous code:\n"
+        f"{code}\n\n"
+        "Do not use iterrows, itertuples, apply with axis=1 or Python loops over rows. "
+        "The result must be identical to the previous solution."
+    )
+
+
+def request_rewrite(df, model_name, prompt):
+    """
+    Ask a model for rewritten code without executing it.
+
+    Args:
+        df (pandas.DataFrame): The dataframe the code operates on
+        model_name (str): Name of the Ollama model to ask
+        prompt (str): The rewrite prompt
+
+    Returns:
+        str or None: The generated code, or None if the model failed
+    """
+    code = generate_code(df, create_ollama_llm(model_name), prompt)
+    return None if is_failed_response(code) else code
+
+
+class CodeOptimizer:
+    """
+    Class for analyzing generated code and replacing it with a faster,
+    vectorized rewrite when it is slow.
+    """
+
+    def __init__(self, time_threshold=None, enabled=None, time_limit=None, rewriter=None):
+        """
+        Initialize the CodeOptimizer.
+
+        Args:
+            time_threshold (float): Execution time in seconds above which a rewrite is requested
+            enabled (bool): Whether the optimization stage runs at all
+            time_limit (float): Maximum seconds any code is run for outside PandasAI
+            rewriter: Function (df, model_name, prompt) returning rewritten code,
+                defaults to request_rewrite
+        """
+        self.time_threshold = (time_threshold if time_threshold is not None
+                               else CODE_OPTIMIZATION_CONFIG["time_threshold"])
+        self.time_limit = (time_limit if time_limit is not None
+                           else CODE_OPTIMIZATION_CONFIG["time_limit"])
+        self.enabled = enabled if enabled is not None else CODE_OPTIMIZATION_CONFIG["enabled"]
+        self.rewriter = rewriter or request_rewrite
+
+    def optimize(self, df, query, response, code, model_name, execution_time=None):
+        """
+        Analyze generated code and try a vectorized rewrite if it is slow.
+
+        A rewrite is requested when the code contains known slow patterns or
+        PandasAI's execution took longer than the threshold. The rewrite is
+        generated without being executed by PandasAI, then run under the time
+        limit, and only kept when it produces the same result as the original
+        answer and runs faster.
+
+        Args:
+            df (pandas.DataFrame): The raw dataframe the code operates on
+            query (str): The original user query
+            response: The response produced by the original code
+            code (str): The original generated code
+            model_name (str): Name of the model that generated the code
+            execution_time (float): Seconds PandasAI spent executing the code, if known
+
+        Returns:
+            tuple: (response, code) for the faster of the two versions
+        """
+        # Plot answers are files managed by the PandasAI pipeline
+        if not self.enabled or df is None or not code or produces_plot(code):
+            return response, code
+
+        findings = find_slow_patterns(code)
+        slow = execution_time is not None and execution_time >= self.time_threshold
+        if not findings and not slow:
+            return response, code
+
+        original_time = execution_time
+        if original_time is None:
+            # Only measured here when PandasAI's own timing is unavailable
+            original_result, original_time = time_code_execution(code, df, self.time_limit)
+            if original_result is None and original_time < self.time_limit:
+                return response, code
+
+        try:
+            new_code = self.rewriter(df, model_name, build_rewrite_prompt(query, code, findings))
+        except Exception as e:
+            print(f"Error requesting vectorized rewrite: {str(e)}")
+            return response, code
+
+        if not new_code or new_code == code:
+            return response, code
+
+        # The rewrite only counts if it beats the original, so stop it there
+        new_result, new_time = time_code_execution(new_code, df,
+                                                   min(original_time, self.time_limit))
+        new_value = new_result.get("value") if isinstance(new_result, dict) else new_result
+        if (new_result is not None and results_match(response, new_value)
+                and new_time < original_time):
+            CODE_REWRITES.inc(outcome="kept")
+            return new_value, new_code
+
+        CODE_REWRITES.inc(outcome="rejected")
+        return response, code
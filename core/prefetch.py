@@ -0,0 +1,179 @@
+"""
+Core functionality for speculatively precomputing answers in the background.
+"""
+import threading
+
+from config import PREFETCH_CONFIG
+from core.dataframe import create_smart_dataframe
+from core.llm import create_ollama_llm
+from core.router import is_failed_response
+from utils.image_handler import make_persistent_copy, is_image_path
+
+
+def normalize_query(query):
+    """
+    Normalize a query so trivially different spellings share a cache entry.
+
+    Args:
+        query (str): The user's query
+
+    Returns:
+        str: The normalized query
+    """
+    return " ".join(query.lower().split()).rstrip("?.! ")
+
+
+class QueryPrefetcher:
+    """
+    Class for answering a list of likely questions in a background thread
+    right after a dataset is loaded, so the first clicks return instantly.
+
+    The work happens on the Ollama server, so prefetching yields to the user
+    there: questions are sent one at a time with a pause in between, and
+    cancelling aborts the in-flight request (see create_ollama_llm) so the
+    server is free for the user's query.
+    """
+
+    def __init__(self, enabled=None, questions=None, delay=None):
+        """
+        Initialize the QueryPrefetcher.
+
+        Args:
+            enabled (bool): Whether prefetching runs at all
+            questions (list): Questions to precompute, defaults to PREFETCH_CONFIG
+            delay (float): Pause in seconds between two prefetched questions
+        """
+        self.enabled = enabled if enabled is not None else PREFETCH_CONFIG["enabled"]
+        self.questions = questions or PREFETCH_CONFIG["questions"]
+        self.delay = delay if delay is not None else PREFETCH_CONFIG["delay"]
+        self.dataset_key = None
+        self.model_name = None
+        self.smart_df = None
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._cancel_event = None
+        self._thread = None
+
+    def start(self, dataset_key, df, model_name, store=None):
+        """
+        Start prefetching for a dataset unless it is already prefetched.
+
+        Args:
+            dataset_key (str): Identifier of the loaded dataset version
+            df (pandas.DataFrame): The dataframe to analyze
+            model_name (str): Name of the Ollama model to use
+            store (ResultStore): Optional store, questions it already answers are skipped
+        """
+        if not self.enabled or (dataset_key, model_name) == (self.dataset_key, self.model_name):
+            return
+
+        self.cancel()
+        with self._lock:
+            self._cache = {}
+            self.smart_df = None
+        self.dataset_key = dataset_key
+        self.model_name = model_name
+
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(df, dataset_key, model_name, list(self.questions), store,
+                  self._cancel_event),
+            name="query-prefetch",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def cancel(self):
+        """Stop the running prefetch and abort its in-flight LLM request."""
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+
+    def reset(self):
+        """Cancel prefetching and drop all cached answers."""
+        self.cancel()
+        with self._lock:
+            self._cache = {}
+            self.smart_df = None
+        self.dataset_key = None
+        self.model_name = None
+
+    def get(self, query, model_name):
+        """
+        Get a prefetched answer for a query.
+
+        Args:
+            query (str): The user's query
+            model_name (str): Name of the model the answer must come from
+
+        Returns:
+            tuple or None: (response, code, details) if the model's answer was prefetched
+        """
+        with self._lock:
+            if model_name != self.model_name:
+                return None
+            return self._cache.get(normalize_query(query))
+
+    def _run(self, df, dataset_key, model_name, questions, store, cancel_event):
+        """
+        Answer the questions one at a time until done or cancelled.
+
+        Args:
+            df (pandas.DataFrame): The dataframe to analyze
+            dataset_key (str): Identifier of the dataset version
+            model_name (str): Name of the Ollama model to use
+            questions (list): Questions to precompute
+            store (ResultStore): Optional store of answers that need no prefetch
+            cancel_event (threading.Event): Set when prefetching must stop
+        """
+        try:
+            # Use a dedicated SmartDataframe so the user's queries never share state;
+            # its LLM aborts the in-flight request when prefetching is cancelled
+            llm = create_ollama_llm(model_name, cancel_event=cancel_event)
+            smart_df = create_smart_dataframe(df, llm)
+        except Exception as e:
+            print(f"Error starting prefetch: {str(e)}")
+            return
+        with self._lock:
+            if not cancel_event.is_set():
+                self.smart_df = smart_df
+
+        for question in questions:
+            if cancel_event.is_set():
+                return
+            if self._is_stored(store, dataset_key, model_name, question):
+                continue
+
+            try:
+                response = smart_df.chat(question)
+                code = smart_df.last_code_executed
+            except Exception as e:
+                print(f"Error prefetching '{question}': {str(e)}")
+                continue
+
+            if is_failed_response(response):
+                continue
+            if is_image_path(response):
+                response = make_persistent_copy(response) or response
+
+            with self._lock:
+                if cancel_event.is_set():
+                    return
+                self._cache[normalize_query(question)] = (
+                    response, code, {"model": model_name, "prefetched": True}
+                )
+
+            # Leave room for the model server between questions
+            if cancel_event.wait(self.delay):
+                return
+
+    @staticmethod
+    def _is_stored(store, dataset_key, model_name, question):
+        """Check whether the store already answers a question, so the LLM is not asked."""
+        if store is None or not dataset_key:
+            return False
+        try:
+            return store.get_result(dataset_key, model_name, question) is not None
+        except Exception as e:
+            print(f"Error reading stored result: {str(e)}")
+            return False
@@ -0,0 +1,349 @@
+"""
+Core functionality for routing queries between small and large models.
+"""
+import re
+import threading
+import time
+
+from config import DEFAULT_MODEL, MODEL_ROUTING_CONFIG
+from core.dataframe import create_smart_dataframe, update_smart_dataframe
+from core.llm import create_ollama_llm
+
+
+# Keywords that indicate a question needs more than a simple aggregation
+COMPLEX_KEYWORDS = [
+    "plot", "chart", "graph", "visual", "histogram", "trend", "correlat",
+    "regress", "predict", "forecast", "compare", "pivot", "distribution",
+    "growth", "rolling", "moving average", "outlier", "cluster", "merge",
+    "percentage", "rank", "over time", "explain", "why",
+]
+
+# Prefix PandasAI uses when it could not answer a question
+FAILED_RESPONSE_PREFIX = "Unfortunately, I was not able to"
+
+
+def estimate_complexity(query):
+    """
+    Estimate how complex a question is with simple lexical heuristics.
+
+    Args:
+        query (str): The user's query
+
+    Returns:
+        int: Complexity score, higher means more complex
+    """
+    text = query.lower()
+    score = sum(1 for keyword in COMPLEX_KEYWORDS if keyword in text)
+
+    # Long or multi-part questions usually need more reasoning
+    if len(text.split()) > 20:
+        score += 1
+    score += len(re.findall(r"\b(and then|then|also|as well as)\b", text))
+    return score
+
+
+def is_failed_response(response):
+    """
+    Check whether a SmartDataframe response signals a failed answer.
+
+    Args:
+        response: The response returned by SmartDataframe.chat
+
+    Returns:
+        bool: True if the response is a failure message
+    """
+    return response is None or (
+        isinstance(response, str) and response.startswith(FAILED_RESPONSE_PREFIX)
+    )
+
+
+class ModelStats:
+    """
+    Class for tracking the observed latency and success rate of each model.
+
+    One instance is shared by all sessions of the process so observations
+    accumulate. Older calls decay, so a model's success rate reflects its
+    recent behaviour and a model can recover after a bad streak.
+    """
+
+    def __init__(self, latency_smoothing, decay):
+        """
+        Initialize the ModelStats.
+
+        Args:
+            latency_smoothing (float): Weight of the latest latency in the moving average
+            decay (float): Weight kept by older calls at each new call
+        """
+        self.latency_smoothing = latency_smoothing
+        self.decay = decay
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, model, latency, success):
+        """
+        Record the outcome of a query answered by a model.
+
+        Args:
+            model (str): Name of the model
+            latency (float): Time taken in seconds
+            success (bool): Whether the model produced an answer
+        """
+        with self._lock:
+            stats = self._stats.setdefault(
+                model, {"calls": 0.0, "successes": 0.0, "latency": None, "last_call": None}
+            )
+            stats["calls"] = stats["calls"] * self.decay + 1
+            stats["successes"] = stats["successes"] * self.decay + (1 if success else 0)
+            if stats["latency"] is None:
+                stats["latency"] = latency
+            else:
+                alpha = self.latency_smoothing
+                stats["latency"] = alpha * latency + (1 - alpha) * stats["latency"]
+            stats["last_call"] = time.time()
+
+    def get(self, model):
+        """
+        Get a snapshot of the statistics of a model.
+
+        Args:
+            model (str): Name of the model
+
+        Returns:
+            dict or None: calls, successes, latency and last_call, None if unobserved
+        """
+        with self._lock:
+            stats = self._stats.get(model)
+            return dict(stats) if stats else None
+
+
+# Statistics shared by the routers of all sessions
+MODEL_STATS = ModelStats(MODEL_ROUTING_CONFIG["latency_smoothing"],
+                         MODEL_ROUTING_CONFIG["stats_decay"])
+
+
+class ModelRouter:
+    """
+    Class for routing each query to a model tier based on its complexity
+    and the observed latency and success rate of each model.
+    """
+
+    def __init__(self, config=None, stats=None):
+        """
+        Initialize the ModelRouter.
+
+        Args:
+            config (dict): Optional routing configuration, defaults to MODEL_ROUTING_CONFIG
+            stats (ModelStats): Optional model statistics, defaults to the process-wide MODEL_STATS
+        """
+        config = config or MODEL_ROUTING_CONFIG
+        self.enabled = config["enabled"]
+        self.tiers = config["tiers"]
+        self.complexity_threshold = config["complexity_threshold"]
+        self.min_success_rate = config["min_success_rate"]
+        self.min_samples = config["min_samples"]
+        self.retry_interval = config["retry_interval"]
+        self.default_model = DEFAULT_MODEL
+        self.available_models = None
+        self.stats = stats or MODEL_STATS
+        self._smart_dfs = {}
+
+    def set_available_models(self, models, default_model=None):
+        """
+        Restrict routing to the models installed in Ollama.
+
+        Args:
+            models (list): Names of the available models
+            default_model (str): Model to use when no tier model is available
+        """
+        self.available_models = list(models) if models else None
+        if default_model:
+            self.default_model = default_model
+
+    def reset_dataframes(self):
+        """Drop the cached SmartDataframes, e.g. after a new dataset is loaded."""
+        self._smart_dfs = {}
+
+    def update_dataframes(self, df):
+        """
+        Point the cached SmartDataframes at new data with the same schema.
+
+        Args:
+            df (pandas.DataFrame): The new data
+        """
+        self._smart_dfs = {
+            model: smart_df for model, smart_df in self._smart_dfs.items()
+            if update_smart_dataframe(smart_df, df)
+        }
+
+    def smart_dataframes(self):
+        """
+        Get the cached SmartDataframes.
+
+        Returns:
+            list: The SmartDataframes created so far, one per model
+        """
+        return list(self._smart_dfs.values())
+
+    def get_smart_dataframe(self, model_name, df):
+        """
+        Get the SmartDataframe for a model, creating it on first use.
+
+        Args:
+            model_name (str): Name of the Ollama model
+            df (pandas.DataFrame): The dataframe to analyze
+
+        Returns:
+            SmartDataframe: The smart dataframe bound to the model
+        """
+        if model_name not in self._smart_dfs:
+            llm = create_ollama_llm(model_name)
+            self._smart_dfs[model_name] = create_smart_dataframe(df, llm)
+        return self._smart_dfs[model_name]
+
+    def _resolve_model(self, model):
+        """
+        Match a configured model name against the installed models.
+
+        ``ollama list`` reports tagged names such as ``mixtral:latest``, so an
+        untagged configured name matches any installed tag of the same model,
+        preferring ``latest``.
+
+        Args:
+            model (str): Configured model name
+
+        Returns:
+            str or None: Installed model name, or None if it is not installed
+        """
+        if self.available_models is None or model in self.available_models:
+            return model
+        if ":" in model:
+            return None
+        matches = [name for name in self.available_models if name.split(":")[0] == model]
+        if not matches:
+            return None
+        return f"{model}:latest" if f"{model}:latest" in matches else matches[0]
+
+    def _tier_models(self, tier):
+        """Get the installed models of a tier."""
+        models = []
+        for model in self.tiers.get(tier, []):
+            resolved = self._resolve_model(model)
+            if resolved and resolved not in models:
+                models.append(resolved)
+        return models
+
+    def _success_rate(self, model):
+        """Get the observed success rate of a model, optimistic when unobserved."""
+        stats = self.stats.get(model)
+        if not stats or stats["calls"] < self.min_samples:
+            return 1.0
+        return stats["successes"] / stats["calls"]
+
+    def _expected_latency(self, model):
+        """Get the smoothed latency of a model, zero when unobserved."""
+        stats = self.stats.get(model)
+        if not stats or stats["latency"] is None:
+            return 0.0
+        return stats["latency"]
+
+    def _is_available(self, model):
+        """
+        Check whether a model may be routed to.
+
+        A model below the minimum success rate is skipped, but tried again
+        once retry_interval has passed since its last call, so it can
+        recover instead of being excluded for good.
+        """
+        if self._success_rate(model) >= self.min_success_rate:
+            return True
+        last_call = self.stats.get(model)["last_call"]
+        return time.time() - last_call >= self.retry_interval
+
+    def _best_model(self, tier):
+        """
+        Pick the fastest available model of a tier.
+
+        Returns:
+            str or None: The selected model, or None if the tier has no available model
+        """
+        candidates = [model for model in self._tier_models(tier) if self._is_available(model)]
+        if not candidates:
+            return None
+        return min(candidates, key=self._expected_latency)
+
+    def route(self, query):
+        """
+        Build the ordered list of models to try for a query.
+
+        The first entry is the model of the tier matching the query
+        complexity; the following entries are escalations to larger tiers.
+
+        Args:
+            query (str): The user's query
+
+        Returns:
+            tuple: (complexity, plan) where plan is a list of (model, tier) pairs
+        """
+        complexity = estimate_complexity(query)
+        tier_names = list(self.tiers)
+        start = 0 if complexity < self.complexity_threshold else len(tier_names) - 1
+
+        plan = []
+        for tier in tier_names[start:]:
+            model = self._best_model(tier)
+            if model and model not in [planned for planned, _ in plan]:
+                plan.append((model, tier))
+
+        if not plan:
+            plan.append((self.default_model, None))
+        return complexity, plan
+
+    def record(self, model, latency, success):
+        """
+        Record the outcome of a query answered by a model.
+
+        Args:
+            model (str): Name of the model
+            latency (float): Time taken in seconds
+            success (bool): Whether the model produced an answer
+        """
+        self.stats.record(model, latency, success)
+
+    def chat(self, query, df):
+        """
+        Answer a query with the routed model, escalating on failure.
+
+        Args:
+            query (str): The user's query
+            df (pandas.DataFrame): The dataframe to analyze
+
+        Returns:
+            tuple: (smart_df, response, code, decision) where decision
+            describes the routing for the conversation entry
+        """
+        complexity, plan = self.route(query)
+        decision = {"complexity": complexity, "attempts": []}
+
+        smart_df, response, code = None, None, None
+        for model, tier in plan:
+            smart_df = self.get_smart_dataframe(model, df)
+            start = time.perf_counter()
+            try:
+                response = smart_df.chat(query)
+                code = smart_df.last_code_executed
+                success = not is_failed_response(response)
+            except Exception as e:
+                response, code, success = f"{FAILED_RESPONSE_PREFIX} answer: {str(e)}", None, False
+            latency = time.perf_counter() - start
+
+            self.record(model, latency, success)
+            decision["attempts"].append({
+                "model": model, "tier": tier,
+                "latency": round(latency, 3), "success": success,
+            })
+            decision.update({"model": model, "tier": tier})
+            if success:
+                break
+
+        decision["escalated"] = len(decision["attempts"]) > 1
+        return smart_df, response, code, decision
@@ -0,0 +1,632 @@
+"""
+Core functionality for persisting sessions, datasets and results across restarts.
+
+Metadata lives in a SQLite database; datasets and dataframe results are
+written as columnar files (Parquet when available, pickle otherwise).
+Each answer is written once as an artifact that conversation entries and
+stored results reference; artifacts nobody references are deleted, and the
+store is pruned to the age and size limits of STORE_CONFIG.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from config import STORE_CONFIG
+from core.prefetch import normalize_query
+from utils.image_handler import is_image_path
+
+
+# Bumped when a table changes incompatibly, older answer tables are dropped
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    dataset_key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    format TEXT NOT NULL,
+    rows INTEGER,
+    columns INTEGER,
+    created_at REAL
+);
+CREATE TABLE IF NOT EXISTS dataset_versions (
+    dataset_key TEXT PRIMARY KEY,
+    parent_key TEXT
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    dataset_key TEXT,
+    model_name TEXT,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    artifact_id TEXT PRIMARY KEY,
+    response_type TEXT NOT NULL,
+    response_value TEXT,
+    size INTEGER,
+    created_at REAL
+);
+CREATE TABLE IF NOT EXISTS conversation (
+    session_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    query TEXT,
+    artifact_id TEXT,
+    code TEXT,
+    details TEXT,
+    PRIMARY KEY (session_id, position)
+);
+CREATE TABLE IF NOT EXISTS results (
+    dataset_key TEXT NOT NULL,
+    model_name TEXT NOT NULL,
+    query TEXT NOT NULL,
+    artifact_id TEXT,
+    code TEXT,
+    details TEXT,
+    created_at REAL,
+    PRIMARY KEY (dataset_key, model_name, query)
+);
+"""
+
+# Drops the answer tables of older schema versions, they only hold cached answers
+MIGRATION = """
+DROP TABLE IF EXISTS conversation;
+DROP TABLE IF EXISTS results;
+DROP TABLE IF EXISTS artifacts;
+"""
+
+# Artifacts no conversation entry or stored result refers to
+UNREFERENCED_ARTIFACTS = """
+SELECT artifact_id, response_type, response_value FROM artifacts
+WHERE artifact_id NOT IN (SELECT artifact_id FROM conversation WHERE artifact_id IS NOT NULL)
+AND artifact_id NOT IN (SELECT artifact_id FROM results WHERE artifact_id IS NOT NULL)
+"""
+
+
+def write_frame(df, path_without_suffix):
+    """
+    Write a dataframe to a columnar file.
+
+    Args:
+        df (pandas.DataFrame): The dataframe to write
+        path_without_suffix (str): Target path, the suffix is chosen by format
+
+    Returns:
+        tuple: (path, format) of the written file
+    """
+    path = f"{path_without_suffix}.parquet"
+    try:
+        df.to_parquet(path)
+        return path, "parquet"
+    except (ImportError, ValueError, TypeError):
+        # No Parquet engine installed, or columns Parquet cannot represent;
+        # the engine may have written part of the file before failing
+        remove_file(path)
+        path = f"{path_without_suffix}.pkl"
+        df.to_pickle(path)
+        return path, "pickle"
+
+
+def remove_file(path):
+    """
+    Delete a file, ignoring files that are already gone.
+
+    Args:
+        path (str): Path of the file
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Error deleting stored file {path}: {str(e)}")
+
+
+def read_frame(path, file_format):
+    """
+    Read a dataframe written by write_frame.
+
+    Args:
+        path (str): Path of the file
+        file_format (str): 'parquet' or 'pickle'
+
+    Returns:
+        pandas.DataFrame or None: The dataframe, or None if it could not be read
+    """
+    import pandas as pd
+
+    try:
+        if file_format == "parquet":
+            return pd.read_parquet(path)
+        return pd.read_pickle(path)
+    except Exception as e:
+        print(f"Error reading stored dataframe {path}: {str(e)}")
+        return None
+
+
+class ResultStore:
+    """
+    Class for snapshotting analyzer state to a local store and restoring it
+    after a server restart.
+    """
+
+    def __init__(self, path=None, max_age_days=None, max_bytes=None):
+        """
+        Initialize the ResultStore. The database is opened on first use.
+
+        Args:
+            path (str): Directory of the store, defaults to STORE_CONFIG['path']
+            max_age_days (float): Age after which unused entries are pruned,
+                defaults to STORE_CONFIG['max_age_days'] (None there disables it)
+            max_bytes (int): Size above which the oldest stored answers and unused
+                datasets are pruned, defaults to STORE_CONFIG['max_bytes'] (None there disables it)
+        """
+        self.path = path or STORE_CONFIG["path"]
+        self.max_age_days = (max_age_days if max_age_days is not None
+                             else STORE_CONFIG["max_age_days"])
+        self.max_bytes = max_bytes if max_bytes is not None else STORE_CONFIG["max_bytes"]
+        self.artifacts_dir = os.path.join(self.path, "artifacts")
+        self.datasets_dir = os.path.join(self.path, "datasets")
+        self._connection = None
+        # Reentrant so multi-statement operations can hold it around _execute calls
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        """Open the SQLite database, create or migrate the schema and prune it."""
+        if self._connection is None:
+            os.makedirs(self.artifacts_dir, exist_ok=True)
+            os.makedirs(self.datasets_dir, exist_ok=True)
+            # Streamlit serves sessions from several threads, access is serialized by _lock
+            connection = sqlite3.connect(
+                os.path.join(self.path, "store.db"), check_same_thread=False
+            )
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                connection.executescript(MIGRATION)
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                # Files of the dropped tables are no longer referenced
+                for name in os.listdir(self.artifacts_dir):
+                    remove_file(os.path.join(self.artifacts_dir, name))
+            connection.executescript(SCHEMA)
+            self._connection = connection
+            self.prune()
+        return self._connection
+
+    def _execute(self, sql, params=(), fetch=None):
+        """
+        Run a statement under the store lock.
+
+        Args:
+            sql (str): The SQL statement
+            params (tuple): Statement parameters
+            fetch (str): None, 'one' or 'all'
+
+        Returns:
+            The fetched row(s), or None
+        """
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                cursor = connection.execute(sql, params)
+                if fetch == "one":
+                    return cursor.fetchone()
+                if fetch == "all":
+                    return cursor.fetchall()
+        return None
+
+    # Datasets
+
+    def has_dataset(self, dataset_key):
+        """
+        Check whether a dataset is stored.
+
+        Args:
+            dataset_key (str): Identifier of the dataset version
+
+        Returns:
+            bool: True if the dataset row exists and its file is still on disk
+        """
+        row = self._execute("SELECT path FROM datasets WHERE dataset_key = ?",
+                            (dataset_key,), fetch="one")
+        return row is not None and os.path.exists(row[0])
+
+    def save_dataset(self, dataset_key, df, parent_key=None):
+        """
+        Store a parsed dataset unless it is already stored.
+
+        A row whose file has gone missing is rewritten along with the file.
+
+        Args:
+            dataset_key (str): Identifier of the dataset version
+            df (pandas.DataFrame): The parsed dataset
+            parent_key (str): Version this one was derived from by appending rows
+        """
+        if parent_key:
+            self._execute("INSERT OR REPLACE INTO dataset_versions VALUES (?, ?)",
+                          (dataset_key, parent_key))
+        if self.has_dataset(dataset_key):
+            return
+        self._connect()
+        path, file_format = write_frame(df, os.path.join(self.datasets_dir, dataset_key))
+        self._execute(
+            "INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?, ?)",
+            (dataset_key, path, file_format, len(df), len(df.columns), time.time())
+        )
+        self.prune()
+
+    def load_dataset(self, dataset_key):
+        """
+        Load a stored dataset.
+
+        Args:
+            dataset_key (str): Identifier of the dataset version
+
+        Returns:
+            pandas.DataFrame or None: The dataset, or None if it is not stored
+        """
+        row = self._execute("SELECT path, format FROM datasets WHERE dataset_key = ?",
+                            (dataset_key,), fetch="one")
+        if row is None or not os.path.exists(row[0]):
+            return None
+        return read_frame(*row)
+
+    # Sessions
+
+    def save_session(self, session_id, dataset_key, model_name):
+        """
+        Record which dataset and model a session uses.
+
+        Args:
+            session_id (str): Identifier of the browser session
+            dataset_key (str): Identifier of the loaded dataset version
+            model_name (str): Name of the selected model
+        """
+        self._execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+            (session_id, dataset_key, model_name, time.time())
+        )
+
+    def load_session(self, session_id):
+        """
+        Load the dataset and model recorded for a session.
+
+        Args:
+            session_id (str): Identifier of the browser session
+
+        Returns:
+            dict or None: {'dataset_key', 'model_name'} or None if unknown
+        """
+        row = self._execute(
+            "SELECT dataset_key, model_name FROM sessions WHERE session_id = ?",
+            (session_id,), fetch="one"
+        )
+        if row is None:
+            return None
+        return {"dataset_key": row[0], "model_name": row[1]}
+
+    # Answers
+
+    def save_answer(self, entry, session_id=None, position=None, dataset_key=None,
+                    model_name=None, artifact_id=None):
+        """
+        Persist an answer as a conversation entry and/or a stored result.
+
+        The response is written once and both rows reference it.
+
+        Args:
+            entry (tuple): (query, response, code, details)
+            session_id (str): Identifier of the browser session, None to skip the conversation
+            position (int): Index of the entry in the conversation
+            dataset_key (str): Identifier of the dataset version, None to skip the results
+            model_name (str): Name of the model that answered, part of the result key
+            artifact_id (str): Existing artifact holding the response, e.g. from get_result
+
+        Returns:
+            str: Identifier of the artifact holding the response
+        """
+        query, response, code, details = entry
+        details = json.dumps(details or {}, default=str)
+        now = time.time()
+
+        # Serialize outside the lock, dataframe files can be large
+        artifact = None if artifact_id else self._serialize(response)
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                # The referenced artifact may have been pruned since it was read
+                if artifact_id and connection.execute(
+                        "SELECT 1 FROM artifacts WHERE artifact_id = ?",
+                        (artifact_id,)).fetchone() is None:
+                    artifact_id = None
+                if not artifact_id:
+                    artifact = artifact or self._serialize(response)
+                    artifact_id = uuid.uuid4().hex
+                    connection.execute("INSERT INTO artifacts VALUES (?, ?, ?, ?, ?)",
+                                       (artifact_id, *artifact, now))
+                if session_id:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO conversation VALUES (?, ?, ?, ?, ?, ?)",
+                        (session_id, position, query, artifact_id, code, details)
+                    )
+                    connection.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?",
+                                       (now, session_id))
+                if dataset_key:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (dataset_key, model_name or "", normalize_query(query),
+                         artifact_id, code, details, now)
+                    )
+            # A replaced entry or result may leave its previous artifact unreferenced
+            self._collect_artifacts()
+            self.prune()
+        return artifact_id
+
+    def load_conversation(self, session_id):
+        """
+        Load the persisted conversation of a session.
+
+        Args:
+            session_id (str): Identifier of the browser session
+
+        Returns:
+            list: Conversation entries (query, response, code, details)
+        """
+        rows = self._execute(
+            "SELECT c.query, a.response_type, a.response_value, c.code, c.details "
+            "FROM conversation c LEFT JOIN artifacts a ON a.artifact_id = c.artifact_id "
+            "WHERE c.session_id = ? ORDER BY c.position",
+            (session_id,), fetch="all"
+        )
+        conversation = []
+        for query, response_type, response_value, code, details in rows:
+            response = self._load_artifact(response_type, response_value)
+            if response is None:
+                response = "This result is no longer available."
+            conversation.append((query, response, code, json.loads(details or "{}")))
+        return conversation
+
+    def clear_conversation(self, session_id):
+        """
+        Delete the persisted conversation of a session and its unused artifacts.
+
+        Args:
+            session_id (str): Identifier of the browser session
+        """
+        with self._lock:
+            self._execute("DELETE FROM conversation WHERE session_id = ?", (session_id,))
+            self._collect_artifacts()
+
+    def get_result(self, dataset_key, model_name, query):
+        """
+        Get a stored answer for a query on a dataset version.
+
+        Args:
+            dataset_key (str): Identifier of the dataset version
+            model_name (str): Name of the model that answered
+            query (str): The user's query
+
+        Returns:
+            tuple or None: (response, code, details, artifact_id) if an answer is stored
+        """
+        row = self._execute(
+            "SELECT a.response_type, a.response_value, r.code, r.details, r.artifact_id "
+            "FROM results r JOIN artifacts a ON a.artifact_id = r.artifact_id "
+            "WHERE r.dataset_key = ? AND r.model_name = ? AND r.query = ?",
+            (dataset_key, model_name or "", normalize_query(query)), fetch="one"
+        )
+        if row is None:
+            return None
+        response = self._load_artifact(row[0], row[1])
+        if response is None:
+            return None
+        return response, row[2], json.loads(row[3] or "{}"), row[4]
+
+    def get_code(self, dataset_key, model_name, query, max_depth=50):
+        """
+        Get generated code stored for a query on an ancestor of a dataset version.
+
+        Code stays valid across appended rows, so it can be replayed on
+        the new version without asking the LLM again. Only code from the
+        same model is returned, and never from the version itself: a
+        missing answer there means it was cleared or never computed.
+
+        Args:
+            dataset_key (str): Identifier of the dataset version
+            model_name (str): Name of the model that generated the code
+            query (str): The user's query
+            max_depth (int): Maximum number of ancestor versions to search
+            
+        Returns:
+            tuple or None: (code, details) of the newest ancestor answer, if any
+        """
+        query = normalize_query(query)
+        for version_key in self._lineage(dataset_key, max_depth + 1)[1:]:
+            row = self._execute(
+                "SELECT code, details FROM results WHERE dataset_key = ? AND model_name = ? "
+                "AND query = ? AND code IS NOT NULL",
+                (version_key, model_name or "", query), fetch="one"
+            )
+            if row is not None and row[0]:
+                return row[0], json.loads(row[1] or "{}")
+        return None
+
+    def invalidate_results(self, dataset_key):
+        """
+        Drop the stored answers of a dataset version, keeping their code for replay.
+
+        Args:
+            dataset_key (str): Identifier of the dataset version
+        """
+        with self._lock:
+            self._execute("UPDATE results SET artifact_id = NULL WHERE dataset_key = ?",
+                          (dataset_key,))
+            self._collect_artifacts()
+
+    def clear_results(self, dataset_key, max_depth=50):
+        """
+        Delete the stored answers and code of a dataset version and its ancestors,
+        so every question on it is recomputed by the LLM.
+
+        Args:
+            dataset_key (str): Identifier of the dataset version
+            max_depth (int): Maximum number of ancestor versions to clear
+        """
+        with self._lock:
+            for version_key in self._lineage(dataset_key, max_depth):
+                self._execute("DELETE FROM results WHERE dataset_key = ?", (version_key,))
+            self._collect_artifacts()
+
+    def _lineage(self, dataset_key, max_depth):
+        """
+        Get a dataset version followed by the versions it was derived from.
+
+        Args:
+            dataset_key (str): Identifier of the dataset version
+            max_depth (int): Maximum number of versions returned
+
+        Returns:
+            list: Dataset keys, newest first
+        """
+        lineage = []
+        while dataset_key is not None and len(lineage) < max_depth:
+            lineage.append(dataset_key)
+            parent = self._execute(
+                "SELECT parent_key FROM dataset_versions WHERE dataset_key = ?",
+                (dataset_key,), fetch="one"
+            )
+            dataset_key = parent[0] if parent else None
+        return lineage
+
+    # Pruning
+
+    def prune(self):
+        """
+        Enforce the age and size limits of the store.
+
+        Sessions, conversations and stored answers unused for longer than
+        max_age_days are deleted, as are datasets no session uses. When the
+        store is still larger than max_bytes, the oldest stored answers and
+        then the oldest datasets no session uses are deleted until it fits.
+        Conversations of live sessions are only pruned by age.
+        """
+        with self._lock:
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                self._execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+                self._execute("DELETE FROM conversation "
+                              "WHERE session_id NOT IN (SELECT session_id FROM sessions)")
+                self._execute("DELETE FROM results WHERE created_at < ?", (cutoff,))
+                for (dataset_key,) in self._unused_datasets(cutoff):
+                    self._delete_dataset(dataset_key)
+                self._collect_artifacts()
+
+            if self.max_bytes is None or self._stored_bytes() <= self.max_bytes:
+                return
+            results = self._execute(
+                "SELECT dataset_key, model_name, query FROM results ORDER BY created_at",
+                fetch="all"
+            )
+            for result in results:
+                self._execute("DELETE FROM results WHERE dataset_key = ? "
+                              "AND model_name = ? AND query = ?", result)
+                self._collect_artifacts()
+                if self._stored_bytes() <= self.max_bytes:
+                    return
+            for (dataset_key,) in self._unused_datasets():
+                self._delete_dataset(dataset_key)
+                if self._stored_bytes() <= self.max_bytes:
+                    return
+
+    def _unused_datasets(self, created_before=None):
+        """Get the keys of datasets no session uses, oldest first."""
+        return self._execute(
+            "SELECT dataset_key FROM datasets "
+            "WHERE dataset_key NOT IN (SELECT dataset_key FROM sessions "
+            "WHERE dataset_key IS NOT NULL) AND created_at < ? ORDER BY created_at",
+            (created_before if created_before is not None else float("inf"),),
+            fetch="all"
+        )
+
+    def _delete_dataset(self, dataset_key):
+        """Delete a stored dataset file and its stored answers."""
+        row = self._execute("SELECT path FROM datasets WHERE dataset_key = ?",
+                            (dataset_key,), fetch="one")
+        if row is not None:
+            remove_file(row[0])
+        self._execute("DELETE FROM datasets WHERE dataset_key = ?", (dataset_key,))
+        self._execute("DELETE FROM results WHERE dataset_key = ?", (dataset_key,))
+
+    def _stored_bytes(self):
+        """Get the size of the stored artifacts and dataset files."""
+        artifacts = self._execute("SELECT COALESCE(SUM(size), 0) FROM artifacts", fetch="one")[0]
+        datasets = 0
+        for (path,) in self._execute("SELECT path FROM datasets", fetch="all"):
+            try:
+                datasets += os.path.getsize(path)
+            except OSError:
+                continue
+        return artifacts + datasets
+
+    # Artifacts
+
+    def _collect_artifacts(self):
+        """Delete the artifacts no conversation entry or stored result refers to."""
+        with self._lock:
+            for artifact_id, response_type, response_value in self._execute(
+                    UNREFERENCED_ARTIFACTS, fetch="all"):
+                if response_type.startswith("dataframe:"):
+                    remove_file(response_value)
+                self._execute("DELETE FROM artifacts WHERE artifact_id = ?", (artifact_id,))
+
+    def _serialize(self, response):
+        """
+        Serialize a response, writing dataframes to columnar files.
+
+        Args:
+            response: The response to serialize
+
+        Returns:
+            tuple: (response_type, response_value, size) ready for SQLite
+        """
+        import pandas as pd
+
+        if isinstance(response, pd.Series):
+            response = response.to_frame()
+        if isinstance(response, pd.DataFrame):
+            self._connect()
+            path, file_format = write_frame(
+                response, os.path.join(self.artifacts_dir, f"result_{uuid.uuid4()}")
+            )
+            return f"dataframe:{file_format}", path, os.path.getsize(path)
+        if is_image_path(response):
+            # Plot files belong to the plots directory and are not counted here
+            return "image", response, 0
+        try:
+            value = json.dumps(response)
+            return "json", value, len(value)
+        except (TypeError, ValueError):
+            # Objects such as plotly figures are kept as their text representation
+            value = str(response)
+            return "text", value, len(value)
+
+    def _load_artifact(self, response_type, response_value):
+        """
+        Deserialize a response written by _serialize.
+
+        Args:
+            response_type (str): The stored response type, None if the artifact is gone
+            response_value (str): The stored value or artifact path
+
+        Returns:
+            The response, or None if its artifact is missing
+        """
+        if response_type is None:
+            return None
+        if response_type.startswith("dataframe:"):
+            return read_frame(response_value, response_type.split(":", 1)[1])
+        if response_type == "image":
+            return response_value if os.path.exists(response_value) else None
+        if response_type == "json":
+            return json.loads(response_value)
+        return response_value
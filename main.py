@@ -11,15 +11,25 @@ import sys
 # Add the parent directory to sys.path to ensure imports work correctly
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from config import setup_environment
+from core.metrics import start_metrics_exporter
 from utils.monkey_patch import apply_system_patches
-from ui.app import run_app
 
 
 def main():
     """Application entry point."""
+    # Prepare directories and temporary file locations
+    setup_environment()
+    
     # Apply necessary patches to prevent external windows
     apply_system_patches()
     
+    # Expose metrics on the configured endpoint and/or file
+    start_metrics_exporter()
+    
+    # Import the UI only once startup is done, it pulls in Streamlit
+    from ui.app import run_app
+    
     # Run the Streamlit application
     run_app()
 
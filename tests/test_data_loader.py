@@ -0,0 +1,50 @@
+"""
+Tests for delta validation and incremental profiles.
+"""
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("streamlit")
+
+from utils.data_loader import build_profile, update_profile, validate_delta_schema
+
+
+def test_delta_that_would_truncate_values_is_rejected():
+    df = pd.DataFrame({"a": [1, 2]})
+    aligned, error = validate_delta_schema(df, pd.DataFrame({"a": [3.5]}))
+    assert aligned is None
+    assert "truncated" in error
+
+
+def test_delta_with_missing_values_cannot_truncate_either():
+    df = pd.DataFrame({"a": [1, 2]})
+    aligned, error = validate_delta_schema(df, pd.DataFrame({"a": [3.5, None]}))
+    assert aligned is None
+    assert "truncated" in error
+
+
+def test_numbers_are_rejected_in_text_columns():
+    df = pd.DataFrame({"name": ["x", "y"]})
+    aligned, error = validate_delta_schema(df, pd.DataFrame({"name": [1, 2]}))
+    assert aligned is None
+    assert "name" in error
+
+
+def test_delta_columns_are_aligned_and_converted():
+    df = pd.DataFrame({"a": [1, 2], "b": ["x", "y"]})
+    aligned, error = validate_delta_schema(df, pd.DataFrame({"b": ["z"], "a": [3.0]}))
+    assert error is None
+    assert list(aligned.columns) == ["a", "b"]
+    assert aligned["a"].dtype == df["a"].dtype
+
+
+def test_profile_follows_upcast_dtypes():
+    df = pd.DataFrame({"a": [1, 2]})
+    delta, error = validate_delta_schema(df, pd.DataFrame({"a": [3, None]}))
+    assert error is None
+    combined = pd.concat([df, delta], ignore_index=True)
+
+    profile = update_profile(build_profile(df), delta, combined.dtypes)
+    assert profile["columns"]["a"]["dtype"] == str(combined["a"].dtype)
+    assert profile["columns"]["a"]["nulls"] == 1
+    assert profile["columns"]["a"]["max"] == 3.0
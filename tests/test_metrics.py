@@ -0,0 +1,48 @@
+"""
+Tests for the metrics primitives.
+"""
+import pytest
+
+from config import METRICS_CONFIG
+from core.metrics import Counter, Histogram, frame_memory_bytes
+
+
+def test_quantile_beyond_last_bucket_is_unbounded():
+    histogram = Histogram("latency", "Latency.", [1, 5])
+    assert histogram.quantile(0.5) is None
+
+    histogram.observe(0.5)
+    histogram.observe(30)
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(0.95) == float("inf")
+
+
+def test_frame_memory_is_deep_and_cached():
+    pd = pytest.importorskip("pandas")
+    frame = pd.DataFrame({"text": ["x" * 100] * 100})
+
+    size = frame_memory_bytes(frame)
+    assert size > frame.memory_usage(deep=False).sum()
+    assert frame_memory_bytes(frame) == size
+
+
+def test_latency_is_split_by_source():
+    histogram = Histogram("latency", "Latency.", [0.1, 5], labelnames=("source",))
+    histogram.observe(3, source="llm")
+    histogram.observe(0.01, source="store")
+
+    assert histogram.quantile(0.5, source="llm") == 5
+    assert histogram.quantile(0.5, source="store") == 0.1
+    assert histogram.quantile(0.5, source="prefetch") is None
+    assert (("source", "llm"), ("le", "+Inf")) in [labels for _, labels, _ in histogram.samples()]
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setitem(METRICS_CONFIG, "enabled", False)
+    counter = Counter("queries", "Queries.")
+    histogram = Histogram("latency", "Latency.", [1])
+    counter.inc()
+    histogram.observe(0.5)
+
+    assert counter.samples() == [("queries", (), 0)]
+    assert histogram.quantile(0.5) is None
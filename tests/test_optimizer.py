@@ -0,0 +1,162 @@
+"""
+Tests for slow generated code detection.
+"""
+import time
+
+import pytest
+
+from core.optimizer import (WORKER_START_TIMEOUT, CodeOptimizer, find_slow_patterns,
+                            produces_plot, results_match, time_code_execution)
+
+SLOW_CODE = (
+    "total = 0\n"
+    "for _, row in dfs[0].iterrows():\n"
+    "    total += row['a']\n"
+    "result = {'type': 'number', 'value': total}\n"
+)
+FAST_CODE = "result = {'type': 'number', 'value': dfs[0]['a'].sum()}"
+
+
+def test_flags_row_iteration_and_row_wise_apply():
+    code = (
+        "for _, row in dfs[0].iterrows():\n"
+        "    total = row['a']\n"
+        "dfs[0].apply(lambda r: r['a'], axis=1)\n"
+    )
+    findings = find_slow_patterns(code)
+    assert any("iterrows" in finding for finding in findings)
+    assert any("apply(axis=1)" in finding for finding in findings)
+
+
+def test_flags_element_access_inside_index_loop():
+    code = (
+        "values = []\n"
+        "for i in range(len(dfs[0])):\n"
+        "    values.append(dfs[0].iloc[i]['a'])\n"
+    )
+    findings = find_slow_patterns(code)
+    assert any("loop over dataframe rows" in finding for finding in findings)
+    assert any(".iloc[]" in finding for finding in findings)
+    assert any(".append()" in finding for finding in findings)
+
+
+def test_ignores_loops_over_columns_and_literals():
+    code = (
+        "cols = []\n"
+        "for c in dfs[0].columns:\n"
+        "    cols.append(c)\n"
+        "for name in ['a', 'b']:\n"
+        "    cols.append(dfs[0].loc[0, name])\n"
+        "for name, series in dfs[0].items():\n"
+        "    cols.append(name)\n"
+    )
+    assert find_slow_patterns(code) == []
+
+
+def test_invalid_code_has_no_findings():
+    assert find_slow_patterns("for (") == []
+    assert find_slow_patterns("") == []
+
+
+def test_results_match_handles_arrays():
+    np = pytest.importorskip("numpy")
+    assert results_match(np.array([1, 2]), np.array([1, 2]))
+    assert not results_match(np.array([1, 2]), np.array([1, 3]))
+    assert not results_match([np.array([1, 2])], [np.array([1, 3])])
+
+
+def test_time_limit_aborts_loops_without_calls():
+    pd = pytest.importorskip("pandas")
+    df = pd.DataFrame({"a": range(10)})
+    code = (
+        "total = 0\n"
+        "while True:\n"
+        "    total += 1\n"
+    )
+    start = time.perf_counter()
+    result, elapsed = time_code_execution(code, df, time_limit=0.2)
+    assert result is None
+    assert elapsed >= 0.2
+    # Worker start-up is not counted in the limit but the loop itself is killed
+    assert time.perf_counter() - start < WORKER_START_TIMEOUT
+
+
+def test_time_limit_returns_results_of_fast_code():
+    pd = pytest.importorskip("pandas")
+    df = pd.DataFrame({"a": range(10)})
+    result, _ = time_code_execution(
+        "result = {'type': 'number', 'value': dfs[0]['a'].sum()}", df, time_limit=30
+    )
+    assert result == {"type": "number", "value": 45}
+
+
+def test_detects_plot_code_without_running_it():
+    plot_code = (
+        "import matplotlib.pyplot as plt\n"
+        "dfs[0]['a'].plot()\n"
+        "plt.savefig('chart.png')\n"
+        "result = {'type': 'plot', 'value': 'chart.png'}\n"
+    )
+    assert produces_plot(plot_code)
+    assert not produces_plot("result = {'type': 'number', 'value': dfs[0]['a'].sum()}")
+
+
+class StubRewriter:
+    """Rewriter returning fixed code and recording its calls."""
+
+    def __init__(self, code=FAST_CODE, error=None):
+        self.code = code
+        self.error = error
+        self.calls = []
+
+    def __call__(self, df, model_name, prompt):
+        self.calls.append((model_name, prompt))
+        if self.error:
+            raise self.error
+        return self.code
+
+
+def make_optimizer(rewriter):
+    return CodeOptimizer(time_threshold=1.0, enabled=True, time_limit=30, rewriter=rewriter)
+
+
+def test_fast_code_without_slow_patterns_is_not_rewritten():
+    pd = pytest.importorskip("pandas")
+    rewriter = StubRewriter()
+    df = pd.DataFrame({"a": range(10)})
+    assert make_optimizer(rewriter).optimize(df, "q", 45, FAST_CODE, "phi3", 0.01) == (45, FAST_CODE)
+    assert rewriter.calls == []
+
+
+def test_slow_patterns_trigger_a_kept_rewrite():
+    pd = pytest.importorskip("pandas")
+    rewriter = StubRewriter()
+    df = pd.DataFrame({"a": range(10)})
+    # Fast enough on its own, the iterrows pattern alone triggers the rewrite
+    response, code = make_optimizer(rewriter).optimize(df, "q", 45, SLOW_CODE, "phi3", 0.5)
+    assert (response, code) == (45, FAST_CODE)
+    assert rewriter.calls[0][0] == "phi3"
+
+
+def test_slow_execution_triggers_a_rewrite_without_patterns():
+    pd = pytest.importorskip("pandas")
+    rewriter = StubRewriter()
+    df = pd.DataFrame({"a": range(10)})
+    original = "result = {'type': 'number', 'value': int(dfs[0]['a'].sum())}"
+    response, code = make_optimizer(rewriter).optimize(df, "q", 45, original, "phi3", 5.0)
+    assert code == FAST_CODE
+    assert len(rewriter.calls) == 1
+
+
+def test_rewrite_with_a_different_result_is_rejected():
+    pd = pytest.importorskip("pandas")
+    rewriter = StubRewriter(code="result = {'type': 'number', 'value': 0}")
+    df = pd.DataFrame({"a": range(10)})
+    assert make_optimizer(rewriter).optimize(df, "q", 45, SLOW_CODE, "phi3", 5.0) == (45, SLOW_CODE)
+
+
+def test_rewrite_failure_keeps_the_original_answer():
+    pd = pytest.importorskip("pandas")
+    rewriter = StubRewriter(error=RuntimeError("model unavailable"))
+    df = pd.DataFrame({"a": range(10)})
+    assert make_optimizer(rewriter).optimize(df, "q", 45, SLOW_CODE, "phi3", 5.0) == (45, SLOW_CODE)
@@ -0,0 +1,99 @@
+"""
+Tests for background answer prefetching.
+"""
+import threading
+
+import pytest
+
+import core.prefetch as prefetch
+from core.prefetch import QueryPrefetcher
+
+
+class StubSmartDataframe:
+    """SmartDataframe answering every question, optionally blocking until released."""
+
+    def __init__(self, release=None):
+        self.release = release
+        self.started = threading.Event()
+        self.questions = []
+        self.last_code_executed = None
+
+    def chat(self, question):
+        self.questions.append(question)
+        self.started.set()
+        if self.release is not None:
+            self.release.wait(5)
+        self.last_code_executed = f"result = '{question}'"
+        return f"answer to {question}"
+
+
+class StubStore:
+    """Store that already answers one question."""
+
+    def __init__(self, stored_question):
+        self.stored_question = stored_question
+
+    def get_result(self, dataset_key, model_name, query):
+        return ("stored", None, {}, "artifact") if query == self.stored_question else None
+
+
+@pytest.fixture
+def smart_df(monkeypatch):
+    stub = StubSmartDataframe()
+    monkeypatch.setattr(prefetch, "create_ollama_llm", lambda model_name, cancel_event=None: None)
+    monkeypatch.setattr(prefetch, "create_smart_dataframe", lambda df, llm: stub)
+    return stub
+
+
+def run_to_completion(prefetcher, **kwargs):
+    prefetcher.start("dataset", None, "phi3", **kwargs)
+    prefetcher._thread.join(5)
+
+
+def test_prefetched_answers_are_served_for_the_same_model(smart_df):
+    prefetcher = QueryPrefetcher(enabled=True, questions=["How many rows?"], delay=0)
+    run_to_completion(prefetcher)
+
+    response, code, details = prefetcher.get("how many rows", "phi3")
+    assert response == "answer to How many rows?"
+    assert details == {"model": "phi3", "prefetched": True}
+    assert prefetcher.get("how many rows", "mixtral") is None
+
+
+def test_disabled_prefetcher_does_not_start(smart_df):
+    prefetcher = QueryPrefetcher(enabled=False, questions=["How many rows?"], delay=0)
+    prefetcher.start("dataset", None, "phi3")
+    assert prefetcher._thread is None
+    assert prefetcher.get("how many rows", "phi3") is None
+
+
+def test_questions_answered_by_the_store_are_skipped(smart_df):
+    prefetcher = QueryPrefetcher(enabled=True, questions=["Stored?", "New?"], delay=0)
+    run_to_completion(prefetcher, store=StubStore("Stored?"))
+
+    assert smart_df.questions == ["New?"]
+    assert prefetcher.get("stored", "phi3") is None
+
+
+def test_answer_arriving_after_cancel_is_discarded(monkeypatch):
+    release = threading.Event()
+    stub = StubSmartDataframe(release=release)
+    monkeypatch.setattr(prefetch, "create_ollama_llm", lambda model_name, cancel_event=None: None)
+    monkeypatch.setattr(prefetch, "create_smart_dataframe", lambda df, llm: stub)
+
+    prefetcher = QueryPrefetcher(enabled=True, questions=["First?", "Second?"], delay=0)
+    prefetcher.start("dataset", None, "phi3")
+    assert stub.started.wait(5)
+    prefetcher.cancel()
+    release.set()
+    prefetcher._thread.join(5)
+
+    assert prefetcher.get("first", "phi3") is None
+    assert stub.questions == ["First?"]
+
+
+def test_reset_forgets_answers(smart_df):
+    prefetcher = QueryPrefetcher(enabled=True, questions=["How many rows?"], delay=0)
+    run_to_completion(prefetcher)
+    prefetcher.reset()
+    assert prefetcher.get("how many rows", "phi3") is None
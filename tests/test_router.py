@@ -0,0 +1,95 @@
+"""
+Tests for model routing.
+"""
+from core.router import ModelRouter, ModelStats, estimate_complexity, is_failed_response
+
+
+CONFIG = {
+    "enabled": True,
+    "tiers": {
+        "small": ["llama3.2:3b", "phi3"],
+        "large": ["mixtral", "llama3"],
+    },
+    "complexity_threshold": 1,
+    "min_success_rate": 0.5,
+    "min_samples": 3,
+    "latency_smoothing": 0.3,
+    "stats_decay": 0.9,
+    "retry_interval": 300,
+}
+
+# Names as reported by `ollama list`
+INSTALLED = ["llama3.2:3b", "phi3:latest", "mixtral:latest", "llama3:8b-instruct"]
+
+
+def make_router():
+    router = ModelRouter(CONFIG, stats=ModelStats(CONFIG["latency_smoothing"],
+                                                  CONFIG["stats_decay"]))
+    router.set_available_models(INSTALLED, default_model="mixtral:latest")
+    return router
+
+
+def test_simple_question_escalates_to_large_tier():
+    complexity, plan = make_router().route("how many rows")
+    assert complexity == 0
+    assert plan == [("llama3.2:3b", "small"), ("mixtral:latest", "large")]
+
+
+def test_complex_question_goes_to_large_tier():
+    complexity, plan = make_router().route("plot a histogram of age")
+    assert complexity >= 1
+    assert plan == [("mixtral:latest", "large")]
+
+
+def test_untagged_name_matches_any_installed_tag():
+    router = make_router()
+    router.tiers = {"large": ["llama3"]}
+    assert router.route("plot it")[1] == [("llama3:8b-instruct", "large")]
+
+
+def test_tagged_name_requires_exact_match():
+    router = make_router()
+    router.tiers = {"small": ["phi3:mini"]}
+    assert router.route("count rows")[1] == [("mixtral:latest", None)]
+
+
+def test_fastest_healthy_model_is_preferred():
+    router = make_router()
+    router.record("llama3.2:3b", 5.0, True)
+    router.record("phi3:latest", 1.0, True)
+    assert router.route("count rows")[1][0] == ("phi3:latest", "small")
+
+    # Once enough calls fail, the model is skipped
+    for _ in range(3):
+        router.record("phi3:latest", 1.0, False)
+    assert router.route("count rows")[1][0] == ("llama3.2:3b", "small")
+
+
+def test_skipped_model_is_retried_and_recovers():
+    router = make_router()
+    for _ in range(4):
+        router.record("phi3:latest", 1.0, False)
+    router.record("llama3.2:3b", 5.0, True)
+    assert router.route("count rows")[1][0][0] == "llama3.2:3b"
+
+    # After the retry interval the failing model gets another chance
+    router.retry_interval = 0
+    assert router.route("count rows")[1][0][0] == "phi3:latest"
+
+    # Older failures decay, so a run of successes restores it
+    router.retry_interval = 300
+    for _ in range(10):
+        router.record("phi3:latest", 1.0, True)
+    assert router.route("count rows")[1][0][0] == "phi3:latest"
+
+
+def test_stats_are_shared_between_routers():
+    stats = ModelStats(0.3, 0.9)
+    ModelRouter(CONFIG, stats=stats).record("phi3:latest", 1.0, True)
+    assert ModelRouter(CONFIG, stats=stats).stats.get("phi3:latest")["calls"] == 1
+
+
+def test_helpers():
+    assert estimate_complexity("show the trend and then compare by region") >= 3
+    assert is_failed_response("Unfortunately, I was not able to answer your question")
+    assert not is_failed_response(42)
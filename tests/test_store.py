@@ -0,0 +1,113 @@
+"""
+Tests for the persistent result store.
+"""
+import os
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from core.store import ResultStore, write_frame
+
+
+def make_store(tmp_path, **limits):
+    limits.setdefault("max_age_days", 365)
+    limits.setdefault("max_bytes", 10 ** 9)
+    return ResultStore(str(tmp_path), **limits)
+
+
+def artifact_files(store):
+    return sorted(os.listdir(store.artifacts_dir))
+
+
+def test_answer_is_written_once_for_conversation_and_results(tmp_path):
+    store = make_store(tmp_path)
+    store.save_session("s", "d", "phi3")
+    frame = pd.DataFrame({"a": [1, 2]})
+    entry = ("Top rows?", frame, "result = 1", {"model": "phi3"})
+
+    artifact_id = store.save_answer(entry, session_id="s", position=0,
+                                    dataset_key="d", model_name="phi3")
+    assert len(artifact_files(store)) == 1
+
+    # A store hit re-uses the same artifact instead of writing a copy
+    response, _, _, stored_id = store.get_result("d", "phi3", "top rows")
+    assert stored_id == artifact_id
+    store.save_answer(("top rows", response, None, {}), session_id="s", position=1,
+                      artifact_id=stored_id)
+    assert len(artifact_files(store)) == 1
+    assert len(store.load_conversation("s")) == 2
+
+
+def test_results_are_keyed_by_model(tmp_path):
+    store = make_store(tmp_path)
+    store.save_answer(("How many rows?", 2, "result = 2", {}), dataset_key="d",
+                      model_name="phi3")
+
+    assert store.get_result("d", "phi3", "how many rows")[0] == 2
+    assert store.get_result("d", "mixtral", "how many rows") is None
+
+
+def test_code_is_replayed_from_ancestors_of_the_same_model(tmp_path):
+    store = make_store(tmp_path)
+    store.save_dataset("v2", pd.DataFrame({"a": [1, 2, 3]}), parent_key="v1")
+    store.save_answer(("How many rows?", 2, "result = 2", {"model": "phi3"}),
+                      dataset_key="v1", model_name="phi3")
+
+    code, details = store.get_code("v2", "phi3", "how many rows")
+    assert code == "result = 2"
+    assert details["model"] == "phi3"
+    # Another model's code is never replayed, nor code of the version itself
+    assert store.get_code("v2", "mixtral", "how many rows") is None
+    assert store.get_code("v1", "phi3", "how many rows") is None
+
+
+def test_clearing_deletes_unreferenced_artifacts(tmp_path):
+    store = make_store(tmp_path)
+    frame = pd.DataFrame({"a": [1, 2]})
+    store.save_answer(("q", frame, None, {}), session_id="s", position=0,
+                      dataset_key="d", model_name="phi3")
+
+    # Still referenced by the stored result
+    store.clear_conversation("s")
+    assert len(artifact_files(store)) == 1
+
+    store.clear_results("d")
+    assert artifact_files(store) == []
+    assert store.get_result("d", "phi3", "q") is None
+
+
+def test_size_cap_prunes_oldest_results(tmp_path):
+    store = make_store(tmp_path)
+    for i in range(3):
+        store.save_answer((f"q{i}", "x" * 100, None, {}), dataset_key="d", model_name="m")
+
+    store.max_bytes = 250
+    store.prune()
+    assert store.get_result("d", "m", "q0") is None
+    assert store.get_result("d", "m", "q2") is not None
+
+
+def test_dataset_with_missing_file_is_rewritten(tmp_path):
+    store = make_store(tmp_path)
+    frame = pd.DataFrame({"a": [1, 2]})
+    store.save_dataset("d", frame)
+    for name in os.listdir(store.datasets_dir):
+        os.remove(os.path.join(store.datasets_dir, name))
+    assert store.load_dataset("d") is None
+
+    store.save_dataset("d", frame)
+    assert store.load_dataset("d")["a"].tolist() == [1, 2]
+
+
+def test_failed_parquet_write_leaves_only_the_pickle(tmp_path, monkeypatch):
+    def partial_parquet(self, path):
+        with open(path, "wb") as f:
+            f.write(b"PAR1")
+        raise ValueError("unsupported column")
+
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", partial_parquet)
+    path, file_format = write_frame(pd.DataFrame({"a": [1]}), str(tmp_path / "frame"))
+
+    assert file_format == "pickle"
+    assert os.listdir(tmp_path) == ["frame.pkl"]
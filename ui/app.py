@@ -1,25 +1,98 @@
 """
 Main Streamlit application UI.
 """
+import uuid
+
 import streamlit as st
 
-from config import APP_TITLE, APP_LAYOUT
+from config import APP_TITLE, APP_LAYOUT, STORE_CONFIG
 from core.analysis import DataAnalyzer
 from core.dataframe import create_smart_dataframe
 from core.llm import create_ollama_llm
+from core.store import ResultStore
 from ui.components import (render_data_preview, render_conversation_messages,
-                                      render_example_questions, render_download_buttons)
+                                      render_example_questions, render_download_buttons,
+                                      render_metrics_dashboard)
 from ui.styles import apply_custom_css
-from utils.data_loader import load_csv_data
+from utils.data_loader import (load_csv_data, get_dataset_key, get_version_key,
+                               validate_delta_schema, build_profile, update_profile)
 from utils.models import get_ollama_models
 
 
+@st.cache_resource
+def get_result_store():
+    """
+    Get the persistent store shared by all sessions.
+    
+    Returns:
+        ResultStore or None: The store, or None if persistence is disabled
+    """
+    if not STORE_CONFIG["enabled"]:
+        return None
+    return ResultStore()
+
+
+def get_session_id():
+    """
+    Get the identifier of the browser session, kept in the URL so it
+    survives server restarts.
+    
+    Returns:
+        str: The session identifier
+    """
+    session_id = st.query_params.get("session")
+    if not session_id:
+        session_id = uuid.uuid4().hex
+        st.query_params["session"] = session_id
+    return session_id
+
+
+def restore_session(analyzer):
+    """
+    Rehydrate the dataset and conversation persisted for a session.
+    
+    Args:
+        analyzer (DataAnalyzer): The analyzer of the session
+        
+    Returns:
+        pandas.DataFrame or None: The restored dataset, if any
+    """
+    store = analyzer.store
+    if store is None:
+        return None
+        
+    try:
+        analyzer.restore_conversation()
+        session = store.load_session(analyzer.session_id)
+        if session is None or not session["dataset_key"]:
+            return None
+            
+        df = store.load_dataset(session["dataset_key"])
+        if df is None:
+            return None
+            
+        model_name = session["model_name"]
+        smart_df = create_smart_dataframe(df, create_ollama_llm(model_name))
+        analyzer.set_dataframe(smart_df, df, model_name, session["dataset_key"])
+        return df
+    except Exception as e:
+        st.warning(f"Could not restore previous session: {str(e)}")
+        return None
+
+
 def initialize_session_state():
     """Initialize Streamlit session state variables."""
     if 'analyzer' not in st.session_state:
-        st.session_state.analyzer = DataAnalyzer()
+        analyzer = DataAnalyzer(store=get_result_store(), session_id=get_session_id())
+        st.session_state.analyzer = analyzer
+        st.session_state.raw_df = restore_session(analyzer)
     if 'raw_df' not in st.session_state:
         st.session_state.raw_df = None
+    if 'profile' not in st.session_state:
+        raw_df = st.session_state.raw_df
+        st.session_state.profile = build_profile(raw_df) if raw_df is not None else None
+    if 'applied_deltas' not in st.session_state:
+        st.session_state.applied_deltas = set()
 
 
 def handle_query_submission():
@@ -41,6 +114,17 @@ def handle_query_submission():
         st.error(error)
 
 
+def handle_example_question(question):
+    """
+    Handle a click on one of the example questions.
+    
+    Args:
+        question (str): The selected example question
+    """
+    st.session_state.user_input = question
+    handle_query_submission()
+
+
 def handle_file_upload(file, model_name):
     """
     Handle CSV file upload and initialization.
@@ -52,12 +136,34 @@ def handle_file_upload(file, model_name):
     Returns:
         bool: Whether the upload was successful
     """
-    df = load_csv_data(file)
+    analyzer = st.session_state.analyzer
+    dataset_key = get_dataset_key(file)
+    
+    # Streamlit reruns this on every interaction, keep the loaded dataset
+    # (including appended deltas) and only switch the model if it changed
+    if st.session_state.get("source_key") == dataset_key and analyzer.raw_df is not None:
+        if analyzer.model_name != model_name:
+            smart_df = create_smart_dataframe(analyzer.raw_df, create_ollama_llm(model_name))
+            analyzer.set_dataframe(smart_df, analyzer.raw_df, model_name, analyzer.dataset_key)
+            analyzer.prefetcher.start(analyzer.dataset_key, analyzer.raw_df, model_name,
+                                      store=analyzer.store)
+        return True
+        
+    # Reuse the parsed dataset from the store instead of reparsing the CSV
+    store = analyzer.store
+    df = store.load_dataset(dataset_key) if store is not None else None
     if df is None:
-        return False
+        df = load_csv_data(file)
+        if df is None:
+            return False
+        if store is not None:
+            store.save_dataset(dataset_key, df)
         
-    # Store the raw dataframe
+    # Store the raw dataframe and its profile
     st.session_state.raw_df = df
+    st.session_state.profile = build_profile(df)
+    st.session_state.source_key = dataset_key
+    st.session_state.applied_deltas = set()
     
     # Create LLM
     llm = create_ollama_llm(model_name)
@@ -66,14 +172,61 @@ def handle_file_upload(file, model_name):
     smart_df = create_smart_dataframe(df, llm)
     
     # Update the analyzer with the new SmartDataframe
-    st.session_state.analyzer.set_dataframe(smart_df)
+    analyzer.set_dataframe(smart_df, df, model_name, dataset_key)
+    
+    # Precompute likely questions while the user reads the preview
+    analyzer.prefetcher.start(dataset_key, df, model_name, store=store)
+    return True
+
+
+def handle_delta_upload(file):
+    """
+    Append a delta CSV file to the loaded dataset.
+    
+    Args:
+        file: Uploaded file object with the rows to append
+    
+    Returns:
+        bool: Whether the delta is part of the loaded dataset
+    """
+    analyzer = st.session_state.analyzer
+    delta_key = get_dataset_key(file)
+    
+    # Streamlit reruns this on every interaction, append each delta only once
+    if delta_key in st.session_state.applied_deltas:
+        return True
+        
+    delta_df = load_csv_data(file)
+    if delta_df is None:
+        return False
+        
+    delta_df, error = validate_delta_schema(analyzer.raw_df, delta_df)
+    if error:
+        st.sidebar.error(error)
+        return False
+        
+    # The new version is identified by the previous version and the delta
+    version_key = get_version_key(analyzer.dataset_key, delta_key)
+    df = analyzer.append_data(delta_df, version_key)
+    
+    st.session_state.raw_df = df
+    st.session_state.profile = update_profile(st.session_state.profile, delta_df, df.dtypes)
+    st.session_state.applied_deltas.add(delta_key)
     return True
 
 
 def render_sidebar():
-    """Render the sidebar UI."""
+    """
+    Render the sidebar UI.
+    
+    Returns:
+        str: The selected page
+    """
     st.sidebar.title("Settings")
     
+    # Page selection
+    page = st.sidebar.radio("Page", ["Analysis", "Admin"], horizontal=True)
+    
     # File uploader
     uploaded_file = st.sidebar.file_uploader("Upload a CSV file", type=["csv"])
     
@@ -81,6 +234,41 @@ def render_sidebar():
     available_models = get_ollama_models()
     model = st.sidebar.selectbox("Select LLM Model", available_models)
     
+    # Model routing toggle
+    router = st.session_state.analyzer.router
+    router.set_available_models(available_models, default_model=model)
+    router.enabled = st.sidebar.checkbox(
+        "Route questions by complexity",
+        value=router.enabled,
+        help="Send simple questions to a small model and escalate to a larger one on failure"
+    )
+    
+    # Generated code optimization toggle
+    optimizer = st.session_state.analyzer.optimizer
+    optimizer.enabled = st.sidebar.checkbox(
+        "Optimize slow generated code",
+        value=optimizer.enabled,
+        help="Detect slow pandas patterns and ask the model for a vectorized rewrite"
+    )
+    
+    # Background prefetch toggle
+    prefetcher = st.session_state.analyzer.prefetcher
+    prefetcher.enabled = st.sidebar.checkbox(
+        "Precompute example questions",
+        value=prefetcher.enabled,
+        help="Answer the example questions in the background right after loading data"
+    )
+    
+    # Stored answer reuse toggle
+    analyzer = st.session_state.analyzer
+    if analyzer.store is not None:
+        analyzer.reuse_results = st.sidebar.checkbox(
+            "Reuse stored answers",
+            value=analyzer.reuse_results,
+            help="Answer repeated questions from the store; untick to recompute "
+                 "and replace the stored answers"
+        )
+    
     # Process file upload
     if uploaded_file is not None:
         if handle_file_upload(uploaded_file, model):
@@ -89,6 +277,16 @@ def render_sidebar():
                 st.sidebar.write(f"Rows: {len(st.session_state.raw_df)}, "
                               f"Columns: {len(st.session_state.raw_df.columns)}")
     
+    # Delta uploader for appending rows to the loaded dataset
+    if st.session_state.raw_df is not None:
+        # Keyed by the base file so a stale delta is not appended to a new upload
+        delta_file = st.sidebar.file_uploader(
+            "Append a delta CSV", type=["csv"],
+            key=f"delta_file_{st.session_state.get('source_key')}"
+        )
+        if delta_file is not None and handle_delta_upload(delta_file):
+            st.sidebar.success(f"Delta appended, {len(st.session_state.raw_df)} rows total")
+    
     # Add a separator
     st.sidebar.markdown("---")
     st.sidebar.markdown("### Actions")
@@ -98,6 +296,13 @@ def render_sidebar():
         st.session_state.analyzer.clear_conversation()
         st.rerun()
     
+    # Clear stored answers button
+    if analyzer.store is not None and analyzer.dataset_key:
+        if st.sidebar.button("Clear Stored Answers",
+                             help="Forget stored answers for this dataset so they are recomputed"):
+            analyzer.clear_stored_results()
+            st.sidebar.success("Stored answers cleared")
+    
     # Add a separator before Downloads section
     st.sidebar.markdown("---")
     
@@ -108,6 +313,7 @@ def render_sidebar():
         st.session_state.raw_df,
         container=st.sidebar  # Pass sidebar as the container
     )
+    return page
 
 
 def render_main_content():
@@ -117,7 +323,7 @@ def render_main_content():
     
     # Display data preview if available
     if st.session_state.raw_df is not None:
-        render_data_preview(st.session_state.raw_df)
+        render_data_preview(st.session_state.raw_df, st.session_state.profile)
     
     # Display conversation
     conversation = st.session_state.analyzer.get_conversation_history()
@@ -131,7 +337,7 @@ def render_main_content():
     )
     
     # Example questions
-    render_example_questions()
+    render_example_questions(on_select=handle_example_question)
 
 
 def run_app():
@@ -146,7 +352,10 @@ def run_app():
     initialize_session_state()
     
     # Render the sidebar
-    render_sidebar()
+    page = render_sidebar()
     
     # Render the main content
-    render_main_content()
\ No newline at end of file
+    if page == "Admin":
+        render_metrics_dashboard()
+    else:
+        render_main_content()
\ No newline at end of file
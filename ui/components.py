@@ -1,33 +1,45 @@
 """
 Reusable UI components for the Streamlit application.
 """
-import pandas as pd
 import streamlit as st
 
+from utils.data_loader import build_profile
 from utils.image_handler import is_image_path
-from config import EXAMPLE_QUESTIONS
+from config import EXAMPLE_QUESTIONS, METRICS_CONFIG
+from core.metrics import METRICS, QUERY_LATENCY
 
 
-def render_data_preview(df):
+def render_data_preview(df, profile=None):
     """
     Render a preview of the loaded dataframe.
     
     Args:
         df (pandas.DataFrame): Dataframe to preview
+        profile (dict): Optional precomputed profile from build_profile
     """
     if df is None:
         return
         
+    import pandas as pd
+    
     with st.expander("Data Preview"):
         st.dataframe(df.head(10), use_container_width=True)
         st.text(f"Total rows: {len(df)}")
         
-        # Display column types
+        # Column statistics come from the incrementally maintained profile when available
+        if profile is None:
+            profile = build_profile(df)
+        stats = [profile["columns"][col] for col in df.columns]
+            
+        # Display column types and statistics
         col_types = pd.DataFrame({
             'Column': df.columns,
-            'Type': df.dtypes.values,
-            'Non-Null Count': df.count().values,
-            'Null Count': df.isna().sum().values
+            'Type': [s["dtype"] for s in stats],
+            'Non-Null Count': [s["non_null"] for s in stats],
+            'Null Count': [s["nulls"] for s in stats],
+            'Min': [s.get("min") for s in stats],
+            'Max': [s.get("max") for s in stats],
+            'Mean': [s["sum"] / s["non_null"] if "sum" in s else None for s in stats]
         })
         st.dataframe(col_types, use_container_width=True)
 
@@ -37,9 +49,15 @@ def render_conversation_messages(conversation):
     Render the conversation history with questions and responses.
     
     Args:
-        conversation (list): List of conversation entries (tuples of query, response, code)
+        conversation (list): List of conversation entries (tuples of query, response, code, details)
     """
-    for i, (query, response, code) in enumerate(conversation):
+    if not conversation:
+        return
+        
+    # Imported lazily, pandas is only needed once there are answers to show
+    import pandas as pd
+    
+    for i, (query, response, code, details) in enumerate(conversation):
         # Display question
         st.markdown(f'<div class="question"><strong>You:</strong> {query}</div>', 
                    unsafe_allow_html=True)
@@ -70,6 +88,9 @@ def render_conversation_messages(conversation):
         # Display answer container end
         st.markdown('</div>', unsafe_allow_html=True)
         
+        # Routing decision
+        render_routing_details(details)
+        
         # Code viewer
         with st.expander(f"View generated code for Query {i+1}"):
             st.markdown('<p class="code-header">Python code used to generate this response:</p>', 
@@ -77,13 +98,50 @@ def render_conversation_messages(conversation):
             st.code(code, language="python")
 
 
-def render_example_questions():
-    """Render the list of example questions."""
+def render_routing_details(details):
+    """
+    Render which model answered a query and how it was routed.
+    
+    Args:
+        details (dict): Routing details recorded with the conversation entry
+    """
+    if not details or not details.get("model"):
+        return
+        
+    caption = f"Answered by {details['model']}"
+    if details.get("tier"):
+        caption += f" ({details['tier']} tier, complexity {details.get('complexity', 0)})"
+    attempts = details.get("attempts", [])
+    if details.get("escalated"):
+        tried = ", ".join(attempt["model"] for attempt in attempts[:-1])
+        caption += f" after escalating from {tried}"
+    if attempts:
+        caption += f" in {attempts[-1]['latency']:.1f}s"
+    if details.get("prefetched"):
+        caption += " (precomputed in the background)"
+    if details.get("restored"):
+        caption += " (reused from a stored result)"
+    if details.get("replayed"):
+        caption += " (stored code replayed on the updated data)"
+    st.caption(caption)
+
+
+def render_example_questions(on_select=None):
+    """
+    Render the list of example questions.
+    
+    Args:
+        on_select: Optional callback receiving the question when it is clicked
+    """
     st.markdown("### Example questions you can ask:")
     
     # Display questions in a more readable format
-    for question in EXAMPLE_QUESTIONS:
-        st.markdown(f"- {question}")
+    for i, question in enumerate(EXAMPLE_QUESTIONS):
+        if on_select is None:
+            st.markdown(f"- {question}")
+        else:
+            st.button(question, key=f"example_question_{i}",
+                      on_click=on_select, args=(question,))
 
 
 def render_download_buttons(conversation, raw_df, container=None):
@@ -116,11 +174,81 @@ def render_download_buttons(conversation, raw_df, container=None):
     if conversation:
         conversation_text = "\n\n".join([
             f"User: {query}\nAI: {str(response)}\nCode:\n{code}" 
-            for query, response, code in conversation
+            for query, response, code, _ in conversation
         ])
         ui.download_button(
             label="Download Conversation",
             data=conversation_text,
             file_name="conversation_history.txt",
             mime="text/plain"
-        )
\ No newline at end of file
+        )
+
+
+def render_metrics_dashboard():
+    """Render the admin page with the current operational metrics."""
+    st.title("Admin")
+    if not METRICS_CONFIG["enabled"]:
+        st.info("Metrics are disabled in METRICS_CONFIG.")
+        return
+    
+    # Collect every sample once, keyed by name and labels
+    samples = {}
+    for metric in METRICS.metrics:
+        for name, labels, value in metric.samples():
+            samples[(name, labels)] = value
+            
+    def total(name):
+        return sum(value for (sample_name, _), value in samples.items() if sample_name == name)
+        
+    def by_label(name, label):
+        return {dict(labels).get(label): value
+                for (sample_name, labels), value in samples.items() if sample_name == name}
+        
+    def latency(q, source="llm"):
+        # Quantiles are bucket upper bounds, beyond the last bucket there is no bound
+        bound = QUERY_LATENCY.quantile(q, source=source)
+        if bound is None:
+            return "n/a"
+        if bound == float("inf"):
+            return f"> {QUERY_LATENCY.buckets[-1]}s"
+        return f"≤ {bound}s"
+    
+    # Query overview
+    queries = total("ttyd_queries_total")
+    errors = total("ttyd_query_errors_total")
+    cols = st.columns(4)
+    cols[0].metric("Queries", int(queries))
+    cols[1].metric("Error rate", f"{errors / queries:.1%}" if queries else "n/a")
+    cols[2].metric("LLM latency p50", latency(0.5))
+    cols[3].metric("LLM latency p95", latency(0.95))
+    
+    # Stored, prefetched and replayed answers skip the LLM, so their latency is reported apart
+    st.markdown("### Answer sources")
+    sources = by_label("ttyd_queries_total", "source")
+    if not sources:
+        st.text("No queries yet.")
+    for source, count in sorted(sources.items()):
+        st.text(f"{source}: {int(count)} queries, p50 {latency(0.5, source)}, "
+                f"p95 {latency(0.95, source)}")
+    
+    # Cache hit rates
+    st.markdown("### Caches")
+    for cache in ("prefetch", "store"):
+        hits = samples.get(("ttyd_cache_lookups_total", (("cache", cache), ("result", "hit"))), 0)
+        misses = samples.get(("ttyd_cache_lookups_total", (("cache", cache), ("result", "miss"))), 0)
+        lookups = hits + misses
+        rate = f"{hits / lookups:.1%}" if lookups else "n/a"
+        st.text(f"{cache}: {int(hits)} hits / {int(lookups)} lookups ({rate})")
+    
+    # Memory and storage
+    st.markdown("### Memory and storage")
+    cols = st.columns(4)
+    cols[0].metric("Sessions", int(total("ttyd_sessions")))
+    cols[1].metric("Session memory", f"{total('ttyd_sessions_memory_bytes') / 1024 ** 2:.1f} MB")
+    cols[2].metric("Dataset store", f"{total('ttyd_dataset_store_bytes') / 1024 ** 2:.1f} MB")
+    cols[3].metric("Saved plots", f"{int(total('ttyd_plot_store_files'))} "
+                   f"({total('ttyd_plot_store_bytes') / 1024 ** 2:.1f} MB)")
+    
+    # Raw export, as scraped by Prometheus
+    with st.expander("Prometheus export"):
+        st.code(METRICS.render(), language="text")
@@ -1,7 +1,8 @@
 """
 Utilities for loading and preprocessing data.
 """
-import pandas as pd
+import hashlib
+
 import streamlit as st
 
 
@@ -15,6 +16,9 @@ def load_csv_data(file):
     Returns:
         pandas.DataFrame or None: The loaded dataframe or None if loading failed
     """
+    # Imported lazily, pandas is only needed once a file is uploaded
+    import pandas as pd
+    
     try:
         df = pd.read_csv(file)
         return df
@@ -23,6 +27,38 @@ def load_csv_data(file):
         return None
 
 
+def get_dataset_key(file):
+    """
+    Compute a content-based identifier for an uploaded file.
+    
+    Args:
+        file: A file-like object containing CSV data
+        
+    Returns:
+        str: Hex digest identifying the file contents
+    """
+    if hasattr(file, "getvalue"):
+        content = file.getvalue()
+    else:
+        content = file.read()
+        file.seek(0)
+    return hashlib.sha256(content).hexdigest()[:32]
+
+
+def get_version_key(parent_key, delta_key):
+    """
+    Compute the identifier of a dataset version produced by appending a delta.
+    
+    Args:
+        parent_key (str): Identifier of the dataset version the delta is appended to
+        delta_key (str): Identifier of the delta file contents
+        
+    Returns:
+        str: Hex digest identifying the new dataset version
+    """
+    return hashlib.sha256(f"{parent_key}:{delta_key}".encode()).hexdigest()[:32]
+
+
 def get_data_summary(df):
     """
     Get a summary of the dataframe for display.
@@ -43,4 +79,114 @@ def get_data_summary(df):
         "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()},
         "missing_values": df.isna().sum().sum(),
         "memory_usage": df.memory_usage(deep=True).sum() / (1024 * 1024)  # MB
-    }
\ No newline at end of file
+    }
+
+
+def validate_delta_schema(df, delta_df):
+    """
+    Check that a delta can be appended to a dataframe and align it.
+    
+    The delta must have exactly the same columns (in any order) and values
+    convertible to the existing column types without loss, e.g. 3.5 cannot
+    be appended to an integer column. Numbers are not accepted into text
+    columns, which would leave them with mixed types.
+    
+    Args:
+        df (pandas.DataFrame): The loaded dataframe
+        delta_df (pandas.DataFrame): The rows to append
+        
+    Returns:
+        tuple: (aligned_delta, error_message), error_message is None if valid
+    """
+    from pandas.api.types import is_integer_dtype, is_numeric_dtype
+    
+    missing = [col for col in df.columns if col not in delta_df.columns]
+    extra = [col for col in delta_df.columns if col not in df.columns]
+    if missing or extra:
+        return None, (f"Delta columns do not match the dataset. "
+                      f"Missing: {missing or 'none'}, unexpected: {extra or 'none'}")
+    
+    aligned = delta_df[list(df.columns)].copy()
+    mismatched = []
+    for col, dtype in df.dtypes.items():
+        values = aligned[col]
+        if values.dtype == dtype or values.isna().all():
+            continue
+        if is_numeric_dtype(dtype) and is_numeric_dtype(values.dtype):
+            # Never truncate values, e.g. floats into an integer column
+            if is_integer_dtype(dtype) and not (values.dropna() % 1 == 0).all():
+                mismatched.append(f"{col} ({values.dtype} values would be truncated to {dtype})")
+            elif not values.hasnans:
+                aligned[col] = values.astype(dtype)
+            # Integer columns receiving missing values are upcast by concat
+            continue
+        if is_numeric_dtype(values.dtype):
+            mismatched.append(f"{col} ({values.dtype} vs {dtype})")
+            continue
+        try:
+            aligned[col] = values.astype(dtype)
+        except (ValueError, TypeError):
+            mismatched.append(f"{col} ({values.dtype} vs {dtype})")
+    if mismatched:
+        return None, f"Delta column types do not match the dataset: {', '.join(mismatched)}"
+    return aligned, None
+
+
+def build_profile(df):
+    """
+    Compute per-column profile statistics that can be updated incrementally.
+    
+    Args:
+        df (pandas.DataFrame): The dataframe to profile
+        
+    Returns:
+        dict: Row count and per-column non-null, null, sum, min and max
+    """
+    from pandas.api.types import is_numeric_dtype
+    
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        stats = {
+            "dtype": str(series.dtype),
+            "non_null": int(series.count()),
+            "nulls": int(series.isna().sum()),
+        }
+        if is_numeric_dtype(series.dtype) and stats["non_null"]:
+            stats.update({"sum": float(series.sum()), "min": float(series.min()),
+                          "max": float(series.max())})
+        columns[col] = stats
+    return {"rows": len(df), "columns": columns}
+
+
+def update_profile(profile, delta_df, dtypes=None):
+    """
+    Update profile statistics with appended rows without rescanning the dataset.
+    
+    Args:
+        profile (dict): Profile returned by build_profile
+        delta_df (pandas.DataFrame): The appended rows
+        dtypes (pandas.Series): Optional column types of the combined dataset,
+            which differ when concat upcasts a column (e.g. int64 with missing values)
+        
+    Returns:
+        dict: The updated profile
+    """
+    delta_profile = build_profile(delta_df)
+    columns = {}
+    for col, stats in profile["columns"].items():
+        delta_stats = delta_profile["columns"][col]
+        merged = {
+            "dtype": str(dtypes[col]) if dtypes is not None else stats["dtype"],
+            "non_null": stats["non_null"] + delta_stats["non_null"],
+            "nulls": stats["nulls"] + delta_stats["nulls"],
+        }
+        numeric = [s for s in (stats, delta_stats) if "sum" in s]
+        if numeric:
+            merged.update({
+                "sum": sum(s["sum"] for s in numeric),
+                "min": min(s["min"] for s in numeric),
+                "max": max(s["max"] for s in numeric),
+            })
+        columns[col] = merged
+    return {"rows": profile["rows"] + delta_profile["rows"], "columns": columns}
@@ -25,6 +25,9 @@ def make_persistent_copy(image_path):
     if not os.path.exists(image_path):
         return None
     
+    # The plots directory may not exist yet if startup was skipped
+    os.makedirs(PLOTS_DIR, exist_ok=True)
+    
     # Create a unique filename using UUID
     unique_id = uuid.uuid4()
     file_extension = Path(image_path).suffix
@@ -0,0 +1,109 @@
+"""
+Utility for benchmarking the cold import time of application modules.
+
+Each module is imported in a fresh interpreter so the measurement reflects
+a cold start of a new server process or worker. Run it from the project root:
+
+    python -m utils.import_benchmark
+    python -m utils.import_benchmark core.analysis pandasai --repeat 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Application modules and the heavy dependencies they may pull in
+DEFAULT_MODULES = [
+    "config",
+    "main",
+    "ui.app",
+    "ui.components",
+    "core.analysis",
+    "core.dataframe",
+    "core.llm",
+    "core.optimizer",
+    "core.prefetch",
+    "core.router",
+    "utils.data_loader",
+    "utils.models",
+    "streamlit",
+    "pandas",
+    "pandasai",
+    "langchain_community.llms",
+    "plotly",
+]
+
+# Snippet run in the child interpreter, prints the import time in seconds
+TIMING_SNIPPET = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def time_import(module, root_dir):
+    """
+    Measure how long importing a module takes in a fresh interpreter.
+
+    Args:
+        module (str): Dotted name of the module to import
+        root_dir (str): Directory added to the child's import path
+
+    Returns:
+        float or None: Import time in seconds, or None if the import failed
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root_dir, env.get("PYTHONPATH")]))
+
+    result = subprocess.run(
+        [sys.executable, "-c", TIMING_SNIPPET.format(module=module)],
+        capture_output=True,
+        text=True,
+        check=False,
+        cwd=root_dir,
+        env=env
+    )
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def benchmark_imports(modules, repeat=3, root_dir=None):
+    """
+    Benchmark the cold import time of several modules.
+
+    Args:
+        modules (list): Dotted names of the modules to import
+        repeat (int): Number of fresh interpreters per module, the best time is kept
+        root_dir (str): Project root directory, defaults to the parent of this package
+
+    Returns:
+        dict: Mapping of module name to best import time in seconds (None if it failed)
+    """
+    root_dir = root_dir or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    timings = {}
+    for module in modules:
+        runs = [time_import(module, root_dir) for _ in range(repeat)]
+        runs = [run for run in runs if run is not None]
+        timings[module] = min(runs) if runs else None
+    return timings
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark cold import times per module.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES,
+                        help="Modules to import (defaults to the application modules)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Fresh interpreters per module, the best time is kept")
+    args = parser.parse_args()
+
+    timings = benchmark_imports(args.modules, repeat=args.repeat)
+    width = max(len(module) for module in timings)
+    for module, seconds in timings.items():
+        value = "import failed" if seconds is None else f"{seconds * 1000:8.1f} ms"
+        print(f"{module:<{width}}  {value}")
+
+
+if __name__ == "__main__":
+    main()
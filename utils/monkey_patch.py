@@ -4,6 +4,9 @@ unwanted behaviors like automatic image viewer opening.
 """
 import os
 
+# Original os.system, set once the patches have been applied
+_original_system = None
+
 
 def override_system_function():
     """
@@ -42,6 +45,14 @@ def override_system_function():
 
 
 def apply_system_patches():
-    """Apply all necessary system function patches."""
+    """
+    Apply all necessary system function patches.
+    
+    Safe to call repeatedly: the patches are only applied once per process.
+    """
+    global _original_system
+    if _original_system is not None:
+        return
+    
     # Override os.system to prevent opening external applications
-    override_system_function()
\ No newline at end of file
+    _original_system = override_system_function()
\ No newline at end of file